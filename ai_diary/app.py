@@ -1,25 +1,131 @@
 # app.py
+import os
+import queue
 import streamlit as st
-from classifier import RobustJournalClassifier
+from classifier import MicroBatcher, RobustJournalClassifier
+from classification_cache import ClassificationCache
+from classifier_client import ClassifierClient
 from database import (
     init_db,
-    save_entry,
-    get_entries_df,
-    auto_process_entry_for_goals,
+    get_entries_page,
     delete_entry,
-    get_goals_df,
-    update_goal
+    get_goals_page,
+    update_goal,
+    get_jobs,
+    get_category_trends,
+    get_goal_status_counts,
+    get_entries_by_ids,
+    get_stage_summary,
+    get_or_create_user,
+    ShardRouter
+)
+from ingestion import IngestionWorker
+from metrics import serve_metrics
+from similarity import similar_entries
+from transcription import (
+    DEFAULT_WHISPER_MODEL,
+    SAMPLE_RATE,
+    WHISPER_MODELS,
+    StreamingTranscriber,
+    TranscriptCache,
+    transcribe_bytes
 )
 
 # ------------------- Initialize -------------------
 st.set_page_config(page_title="AI Diary Assistant", layout="wide")
 st.title("AI Diary Assistant")
+
+# With DIARY_CLASSIFIER_URL (http://host:port or unix:///path.sock) every UI process
+# talks to one shared classifier_server.py instead of loading its own model
+CLASSIFIER_URL = os.environ.get("DIARY_CLASSIFIER_URL")
+if CLASSIFIER_URL:
+    classifier = ClassifierClient(CLASSIFIER_URL)
+else:
+    classifier = RobustJournalClassifier(cache=ClassificationCache())
+# Start loading the model in the background so the first page render is not blocked
+classifier.warmup()
 init_db()
+transcripts = TranscriptCache()
+# DIARY_SHARD_DIR switches to one database file per user
+router = ShardRouter()
+
+@st.cache_resource
+def get_ingestion_worker():
+    # One background worker pool per server process, shared by all sessions
+    return IngestionWorker(classifier, router=router).start()
+
+ingestion = get_ingestion_worker()
+
+@st.cache_resource
+def get_entry_classifier():
+    # Concurrent "Classify Entry" clicks from all sessions are merged into shared model passes;
+    # the classifier server already does this on its side
+    return classifier if CLASSIFIER_URL else MicroBatcher(classifier)
+
+# ------------------- Session user -------------------
+# Behind an authenticating reverse proxy, DIARY_USER_HEADER names the request header carrying the
+# signed-in user and each session is bound to it. Without it the sidebar box is only a profile
+# switcher for a single-person install: anyone who can open the page can read any user's diary.
+USER_HEADER = os.environ.get("DIARY_USER_HEADER")
+
+def request_headers():
+    if hasattr(st, "context"):
+        return st.context.headers
+    from streamlit.web.server.websocket_headers import _get_websocket_headers
+    return _get_websocket_headers() or {}
 
-classifier = RobustJournalClassifier()
+if USER_HEADER:
+    username = (request_headers().get(USER_HEADER) or "").strip()
+    if not username:
+        st.error(f"Missing {USER_HEADER} header; open the diary through the login proxy.")
+        st.stop()
+    st.sidebar.write(f"Signed in as {username}")
+else:
+    username = st.sidebar.text_input(
+        "Diary profile", value="default_user", key="username",
+        help="Switches between diaries on this install. This is not a login; set DIARY_USER_HEADER to "
+             "take the user from an authenticating proxy."
+    ).strip() or "default_user"
+user_id = get_or_create_user(username)
+user_db = router.path(user_id)
+
+@st.cache_resource
+def start_metrics_server():
+    # Prometheus scrape target on /metrics (and /metrics.json) when DIARY_METRICS_PORT is set
+    port = os.environ.get("DIARY_METRICS_PORT")
+    return serve_metrics(int(port)) if port else None
+
+start_metrics_server()
+
+model_state = classifier.model_status()
+st.sidebar.write(f"Model ({classifier.backend}): {model_state}")
+
+PAGE_SIZE = 20
+
+def current_cursor(key, filters):
+    """Cursor of the page being shown; changing the filters goes back to page one."""
+    state = st.session_state
+    if state.get(f"{key}_filters") != filters:
+        state[f"{key}_filters"] = filters
+        state[f"{key}_cursors"] = [None]
+    return state[f"{key}_cursors"][-1]
+
+def pager_controls(key, next_cursor):
+    cursors = st.session_state[f"{key}_cursors"]
+    col_prev, col_page, col_next = st.columns(3)
+    with col_prev:
+        if len(cursors) > 1 and st.button("Previous page", key=f"{key}_prev"):
+            cursors.pop()
+            st.experimental_rerun()
+    with col_page:
+        st.write(f"Page {len(cursors)}")
+    with col_next:
+        if next_cursor and st.button("Next page", key=f"{key}_next"):
+            cursors.append(next_cursor)
+            st.experimental_rerun()
 
 # ------------------- Tabs -------------------
-tabs = st.tabs(["Add Entry", "Browse Entries", "Goals Dashboard"])
+tabs = st.tabs(["Add Entry", "Browse Entries", "Goals Dashboard", "Trends", "Voice Entry"])
 
 # ------------------- Tab 1: Add Entry -------------------
 with tabs[0]:
@@ -27,9 +133,12 @@ with tabs[0]:
 
     entry_text = st.text_area("Write your entry here:", key="entry_textarea")
 
+    if model_state != "ready":
+        st.info("The classifier is still loading; the first classification may take a moment.")
+
     if st.button("Classify Entry", key="classify_entry"):
         if entry_text.strip():
-            result = classifier.classify_single(entry_text)
+            result = get_entry_classifier().classify_single(entry_text)
             st.write("### Classification Result")
             st.json({
                 "entry": result.entry,
@@ -40,49 +149,97 @@ with tabs[0]:
                 "sub_confidence": result.sub_confidence,
                 "processing_time": result.processing_time,
                 "success": result.success,
-                "error_message": result.error_message
+                "error_message": result.error_message,
+                "cached": result.cached,
+                "stage_timings_ms": result.stage_timings
             })
+            if result.chunks:
+                st.write(f"Long entry: classified as {len(result.chunks)} sentence windows")
+                st.dataframe([{"text": result.entry[c["start"]:c["end"]], "main_category": c["main_category"],
+                               "sub_category": c["sub_category"], "confidence": c["confidence"]}
+                              for c in result.chunks])
         else:
             st.warning("Please enter some text first!")
 
     if st.button("Submit Entry", key="submit_entry"):
         if entry_text.strip():
-            result = classifier.classify_single(entry_text)
-            entry_id = save_entry(result)
-            auto_process_entry_for_goals(
-                entry_id, result.entry, result.main_category, result.sub_category
-            )
-            st.success("Entry saved successfully!")
+            # Stored as a pending job right away; classification and goals run in the background
+            job_id = ingestion.submit(entry_text, user_id=user_id)
+            st.session_state.setdefault("submitted_jobs", []).append(job_id)
+            st.success("Entry saved! It will be classified in the background.")
         else:
             st.warning("Cannot submit empty entry!")
 
+    submitted = st.session_state.get("submitted_jobs", [])
+    if submitted:
+        st.write("### Recent submissions")
+        for job in get_jobs(submitted[-10:], user_id=user_id):
+            detail = f" — {job['error_message']}" if job["error_message"] else ""
+            st.write(f"Job {job['job_id']}: {job['status']}{detail}")
+        st.button("Refresh status", key="refresh_jobs")
+
 # ------------------- Tab 2: Browse Entries -------------------
 with tabs[1]:
     st.header("Browse Diary Entries")
-    df = get_entries_df()
-    if not df.empty:
-        for _, row in df.iterrows():
+    with st.expander("Filters"):
+        category = st.selectbox("Category", ["All"] + list(classifier.category_desc), key="browse_category")
+        tag = st.text_input("Tag", key="browse_tag").strip()
+        start_date = end_date = None
+        if st.checkbox("Filter by date", key="browse_by_date"):
+            start_date = st.date_input("From", key="browse_from").isoformat()
+            end_date = st.date_input("To", key="browse_to").isoformat()
+
+    filters = (user_id, category, tag, start_date, end_date)
+    rows, next_cursor = get_entries_page(
+        cursor=current_cursor("entries", filters),
+        limit=PAGE_SIZE,
+        category=None if category == "All" else category,
+        tag=tag or None,
+        start_date=start_date,
+        end_date=end_date,
+        db_path=user_db,
+        user_id=user_id,
+    )
+    if rows:
+        for row in rows:
             st.subheader(f"{row['main_category']} - {row['secondary_category'] or ''}")
             st.write(row['entry_text'])
             col1, col2 = st.columns(2)
 
             with col1:
                 if st.button(f"Delete Entry {row['entry_id']}", key=f"del_entry_{row['entry_id']}"):
-                    delete_entry(row['entry_id'])
+                    delete_entry(row['entry_id'], db_path=user_db, user_id=user_id)
                     st.success("Entry deleted!")
                     st.experimental_rerun()
 
             with col2:
                 st.write(f"Tags: {', '.join(row['tags'])}")
+                if st.button("Similar entries", key=f"similar_{row['entry_id']}"):
+                    hits = similar_entries(row['entry_id'], db_path=user_db, user_id=user_id)
+                    related = get_entries_by_ids([entry_id for entry_id, _ in hits], db_path=user_db, user_id=user_id)
+                    for entry_id, score in hits:
+                        if entry_id in related:
+                            st.caption(f"{score:.2f} · {related[entry_id]['main_category']}: {related[entry_id]['entry_text'][:200]}")
+                    if not hits:
+                        st.caption("No similar entries yet.")
+        pager_controls("entries", next_cursor)
     else:
         st.info("No diary entries yet.")
 
 # ------------------- Tab 3: Goals Dashboard -------------------
 with tabs[2]:
     st.header("Goals Dashboard")
-    df_goals = get_goals_df()
-    if not df_goals.empty:
-        for _, row in df_goals.iterrows():
+    status_options = ["planned", "in_progress", "completed", "dropped"]
+    status_filter = st.selectbox("Show", ["All"] + status_options, key="goals_status_filter")
+    goal_rows, next_cursor = get_goals_page(
+        cursor=current_cursor("goals", (user_id, status_filter)),
+        limit=PAGE_SIZE,
+        status=None if status_filter == "All" else status_filter,
+        db_path=user_db,
+        user_id=user_id,
+    )
+    if goal_rows:
+        for row in goal_rows:
             st.write(
                 f"{row['goal_text']} — Status: {row['status']} — Updated: {row['updated_at']}"
             )
@@ -93,7 +250,6 @@ with tabs[2]:
                 key=f"goal_text_{row['goal_id']}",
             )
 
-            status_options = ["planned", "in_progress", "completed", "dropped"]
             status_index = (
                 status_options.index(row['status']) if row['status'] in status_options else 0
             )
@@ -102,8 +258,102 @@ with tabs[2]:
             )
 
             if st.button(f"Update Goal {row['goal_id']}", key=f"update_goal_{row['goal_id']}"):
-                update_goal(row['goal_id'], goal_text, status)
+                update_goal(row['goal_id'], goal_text, status, db_path=user_db, user_id=user_id)
                 st.success("Goal updated!")
                 st.experimental_rerun()
+        pager_controls("goals", next_cursor)
     else:
         st.info("No goals tracked yet.")
+
+# ------------------- Tab 4: Trends -------------------
+with tabs[3]:
+    import datetime
+    import pandas as pd
+
+    st.header("Trends")
+    days = st.slider("Days to show", min_value=7, max_value=365, value=90, key="trend_days")
+    start = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+    trends = pd.DataFrame(get_category_trends(start_date=start, db_path=user_db, user_id=user_id))
+    if not trends.empty:
+        st.write("### Entries per day by category")
+        st.line_chart(trends.pivot_table(index="day", columns="main_category", values="entry_count", fill_value=0))
+        st.write("### Mean confidence by category")
+        weighted = trends.assign(conf=trends["mean_confidence"] * trends["entry_count"]).groupby("main_category")
+        st.bar_chart(weighted["conf"].sum() / weighted["entry_count"].sum())
+    else:
+        st.info("No entries in this period.")
+
+    goal_counts = get_goal_status_counts(db_path=user_db, user_id=user_id)
+    if goal_counts:
+        st.write("### Goals by status")
+        st.bar_chart(pd.Series(goal_counts, name="goals"))
+
+    stage_summary = get_stage_summary(since=start, db_path=user_db, user_id=user_id)
+    if stage_summary:
+        st.write("### Where submit time goes (ms per entry)")
+        st.dataframe(pd.DataFrame(stage_summary).set_index("stage").round(2))
+
+# ------------------- Tab 5: Voice Entry -------------------
+with tabs[4]:
+    st.header("Voice Entry")
+    whisper_model = st.selectbox("Whisper model", WHISPER_MODELS, index=WHISPER_MODELS.index(DEFAULT_WHISPER_MODEL),
+                                 key="whisper_model", help="tiny and base keep up with live speech on a CPU")
+    # Transcripts go through the same background queue as typed entries
+    voice_jobs = st.session_state.setdefault("submitted_jobs", [])
+
+    audio_file = st.file_uploader("Upload a recording", type=["wav", "mp3", "m4a", "ogg", "webm", "flac"],
+                                  key="voice_upload")
+    if audio_file is not None and st.button("Transcribe and save", key="voice_transcribe"):
+        try:
+            with st.spinner("Transcribing..."):
+                text, _ = transcribe_bytes(audio_file.getvalue(), whisper_model, cache=transcripts)
+        except (ImportError, RuntimeError, OSError) as e:
+            st.error(f"Transcription failed: {e}")
+        else:
+            if text:
+                voice_jobs.append(ingestion.submit(text, user_id=user_id))
+                st.success("Transcript saved! It will be classified in the background.")
+                st.write(text)
+            else:
+                st.warning("No speech found in the recording.")
+
+    st.write("### Record live")
+    try:
+        import av
+        from streamlit_webrtc import WebRtcMode, webrtc_streamer
+    except ImportError:
+        st.info("Install streamlit-webrtc to record straight from the browser.")
+    else:
+        ctx = webrtc_streamer(key="voice_live", mode=WebRtcMode.SENDONLY, audio_receiver_size=1024,
+                              media_stream_constraints={"audio": True, "video": False})
+        transcriber = st.session_state.get("voice_transcriber")
+        if ctx.audio_receiver:
+            if transcriber is None:
+                # Each pause-delimited segment becomes its own entry as soon as it is finished
+                transcriber = st.session_state["voice_transcriber"] = StreamingTranscriber(
+                    lambda text, uid=user_id: voice_jobs.append(ingestion.submit(text, user_id=uid)),
+                    whisper_model)
+            resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+            status = st.empty()
+            while ctx.audio_receiver:
+                try:
+                    frames = ctx.audio_receiver.get_frames(timeout=1)
+                except queue.Empty:
+                    break
+                for frame in frames:
+                    for out in resampler.resample(frame):
+                        transcriber.feed(out.to_ndarray().reshape(-1))
+                if transcriber.error:
+                    status.error(f"Transcription failed: {transcriber.error}")
+                else:
+                    status.write(transcriber.partial or "Listening...")
+        elif transcriber is not None:
+            # Recording stopped: transcribe the tail and save the last segment
+            segments = transcriber.close()
+            del st.session_state["voice_transcriber"]
+            if transcriber.error:
+                st.error(f"Transcription failed: {transcriber.error}")
+            if segments:
+                st.success(f"Saved {len(segments)} voice entries; see Recent submissions under Add Entry.")
+                for segment in segments:
+                    st.write(f"- {segment}")
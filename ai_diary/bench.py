@@ -0,0 +1,256 @@
+# bench.py
+"""Benchmark the classification and storage hot paths on a synthetic diary.
+
+    python bench.py --entries 2000 --out bench.json
+    python bench.py --entries 2000 --compare bench.json   # exit 1 on regression
+    python bench.py --real --entries 50                   # use the real model
+
+By default a deterministic stub stands in for the NLI model so the suite runs
+offline; it exercises the same batching, scoring and storage code paths.
+Each stage reports p50/p95/p99 latency, throughput, the resident memory after it
+ran and how much that grew during the stage; the process-wide peak goes in meta.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from classifier import RobustJournalClassifier
+from zero_shot import ZeroShotEngine
+import database as db
+
+TEMPLATES = {
+    "Goals": ["I want to save R{n} for {thing} by {month}.", "My goal is to learn {skill} this year.",
+              "I'm going to run a {n}km race in {month}."],
+    "Emotions": ["Today I felt {mood} after {event}.", "I can't shake this {mood} feeling since {event}."],
+    "Plans": ["Tomorrow I will {task} and then {task}.", "Next week: {task}, {task}, and call {person}."],
+    "Relationships": ["Had a long talk with {person} about {thing}.", "{person} and I argued about {thing} again."],
+    "Challenges": ["Struggling with {problem} at work.", "I keep putting off {task} and it is stressing me."],
+    "Gratitude": ["Grateful for {person} and a quiet {month} morning.", "Thankful that {event} went well."],
+    "Health": ["Slept {n} hours, did a {n} minute workout.", "Doctor said to cut back on {thing}."],
+    "Habits": ["Day {n} of no phone before breakfast.", "Kept my {skill} routine going every day this week."],
+    "Reflection": ["Looking back, {event} taught me about {thing}.", "I realise {problem} was never the real issue."],
+}
+FILL = {
+    "thing": ["a car", "university fees", "a holiday", "sugar", "money", "the house", "my career"],
+    "month": ["January", "March", "June", "September", "December"],
+    "skill": ["Spanish", "Python", "guitar", "cooking", "journaling"],
+    "mood": ["anxious", "calm", "frustrated", "joyful", "lonely", "stressed"],
+    "event": ["the interview", "the exam", "dinner with family", "the move", "the meeting"],
+    "task": ["buy groceries", "finish the report", "go to the bank", "clean the flat", "book the dentist"],
+    "person": ["my sister", "Thabo", "my manager", "Mom", "an old friend"],
+    "problem": ["procrastination", "time management", "imposter syndrome", "workload"],
+}
+FILLER = ("and honestly the day went on like most days do with small things to handle and little time "
+          "to think about any of it properly before bed").split()
+
+
+def synthetic_entries(count: int, mean_words: int = 40, sigma: float = 0.6, seed: int = 0) -> List[str]:
+    """Entries built from category templates, padded to a log-normal word count."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(count):
+        template = rng.choice(TEMPLATES[rng.choice(list(TEMPLATES))])
+        text = template.format(n=rng.randint(2, 5000), **{k: rng.choice(v) for k, v in FILL.items()})
+        target = max(3, int(rng.lognormvariate(0, sigma) * mean_words))
+        words = text.split()
+        while len(words) < target:
+            words.extend(FILLER[:target - len(words)])
+        out.append(" ".join(words))
+    return out
+
+
+class StubEngine(ZeroShotEngine):
+    """Deterministic stand-in for the NLI model (hash-derived logits, optional per-pair delay)."""
+
+    def __init__(self, pair_latency_ms: float = 0.0):
+        self.pair_latency = pair_latency_ms / 1000.0
+
+    def entailment_logits(self, premises, labels, batch_size=32):
+        n_pairs = sum(len(ls) for ls in labels)
+        if self.pair_latency:
+            time.sleep(self.pair_latency * n_pairs)
+        return [[int(hashlib.md5(f"{p}|{l}".encode()).hexdigest()[:6], 16) % 1000 / 200.0 for l in ls]
+                for p, ls in zip(premises, labels)]
+
+    def embed(self, texts, batch_size=16):
+        out = []
+        for t in texts:
+            v = [0.0] * 64
+            for w in t.lower().split():
+                v[int(hashlib.md5(w.encode()).hexdigest()[:4], 16) % 64] += 1.0
+            norm = sum(x * x for x in v) ** 0.5 or 1.0
+            out.append([x / norm for x in v])
+        return out
+
+
+def make_classifier(real: bool, pair_latency_ms: float) -> RobustJournalClassifier:
+    clf = RobustJournalClassifier()
+    if not real:
+        clf._engine = StubEngine(pair_latency_ms)
+    return clf
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the process peak where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def run_stage(name: str, calls: List[Callable[[], object]], items_per_call: int = 1) -> Dict:
+    latencies = []
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    for call in calls:
+        t = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t)
+    wall = time.perf_counter() - t0
+    rss_after = rss_mb()
+    latencies.sort()
+    stats = {
+        "stage": name,
+        "calls": len(calls),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3) if latencies else 0.0,
+        "throughput_per_s": round(len(calls) * items_per_call / wall, 1) if wall else 0.0,
+        "rss_mb": round(rss_after, 1),
+        "rss_delta_mb": round(rss_after - rss_before, 1),
+    }
+    print(f"{name:<28} p50={stats['p50_ms']:>9.3f}ms p95={stats['p95_ms']:>9.3f}ms "
+          f"p99={stats['p99_ms']:>9.3f}ms {stats['throughput_per_s']:>10.1f}/s rss={stats['rss_mb']}MB ({stats['rss_delta_mb']:+}MB)",
+          file=sys.stderr)
+    return stats
+
+
+def run(args) -> Dict:
+    entries = synthetic_entries(args.entries, args.mean_words, args.sigma, args.seed)
+    clf = make_classifier(args.real, args.pair_latency_ms)
+    workdir = tempfile.mkdtemp(prefix="diary-bench-")
+    path = os.path.join(workdir, "bench.db")
+    db.init_db(path)
+
+    single = entries[:args.single_entries]
+    results = {}
+    stages = [run_stage("classify_single", [lambda e=e: clf.classify_single(e) for e in single])]
+
+    batches = [entries[i:i + args.batch_size] for i in range(0, len(entries), args.batch_size)]
+    stages.append(run_stage("classify_batch", [lambda b=b: results.update(enumerate(clf.classify_batch(b), len(results)))
+                                               for b in batches], items_per_call=args.batch_size))
+    classified = [results[i] for i in range(len(entries))]
+
+    ids: List[int] = []
+    stages.append(run_stage("save_entry", [lambda r=r: ids.append(db.save_entry(r, db_path=path))
+                                           for r in classified[:len(classified) // 2]]))
+    chunks = [classified[i:i + args.batch_size] for i in range(len(classified) // 2, len(classified), args.batch_size)]
+    stages.append(run_stage("save_entries", [lambda c=c: ids.extend(db.save_entries(c, db_path=path)) for c in chunks],
+                            items_per_call=args.batch_size))
+    stages.append(run_stage("auto_process_entry_for_goals", [
+        lambda i=i, r=r: db.auto_process_entry_for_goals(i, r.entry, r.main_category, r.sub_category, db_path=path)
+        for i, r in zip(ids, classified)]))
+    stages.append(run_stage("find_existing_goals_like", [
+        lambda e=e: db.find_existing_goals_like(e, db_path=path) for e in entries[:args.query_calls]]))
+
+    state = {"cursor": None}
+
+    def next_page():
+        _, state["cursor"] = db.get_entries_page(cursor=state["cursor"], db_path=path)
+
+    stages.append(run_stage("get_entries_page", [next_page] * args.query_calls))
+    try:
+        import pandas  # noqa: F401
+        stages.append(run_stage("get_entries_df", [lambda: db.get_entries_df(db_path=path)] * max(1, args.query_calls // 20)))
+    except ImportError:
+        print("pandas not installed; skipping get_entries_df", file=sys.stderr)
+    stages.append(run_stage("get_category_trends", [lambda: db.get_category_trends(db_path=path)] * args.query_calls))
+    db.close_conns()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "entries": args.entries,
+            "mean_words": args.mean_words,
+            "batch_size": args.batch_size,
+            "model": "real" if args.real else f"stub({args.pair_latency_ms}ms/pair)",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        },
+        "stages": stages,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Stages whose p95 latency regressed by more than tolerance (a fraction)."""
+    base = {s["stage"]: s for s in baseline["stages"]}
+    regressions = []
+    for s in current["stages"]:
+        b = base.get(s["stage"])
+        if not b or not b["p95_ms"]:
+            continue
+        change = (s["p95_ms"] - b["p95_ms"]) / b["p95_ms"]
+        flag = "REGRESSION" if change > tolerance else ""
+        print(f"{s['stage']:<28} p95 {b['p95_ms']:>9.3f} -> {s['p95_ms']:>9.3f}ms ({change:+.1%}) {flag}",
+              file=sys.stderr)
+        if flag:
+            regressions.append(s["stage"])
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--entries", type=int, default=1000)
+    ap.add_argument("--mean-words", type=int, default=40, help="median entry length in words")
+    ap.add_argument("--sigma", type=float, default=0.6, help="log-normal spread of entry lengths")
+    ap.add_argument("--batch-size", type=int, default=16)
+    ap.add_argument("--single-entries", type=int, default=100, help="entries timed through classify_single")
+    ap.add_argument("--query-calls", type=int, default=200)
+    ap.add_argument("--pair-latency-ms", type=float, default=0.0, help="simulated stub cost per hypothesis pair")
+    ap.add_argument("--real", action="store_true", help="use the real model instead of the stub")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="write results as JSON")
+    ap.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown before flagging")
+    args = ap.parse_args(argv)
+
+    report = run(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            if compare(report, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# bench_backends.py
+"""Compare model backends on latency and accuracy.
+
+    python bench_backends.py --backends pytorch quantized
+    python bench_backends.py --backends pytorch onnx --onnx-path ./bart-mnli-onnx
+    python bench_backends.py --samples labelled.jsonl --synthetic 0
+
+The first row is always the original classification path, a
+``transformers.pipeline("zero-shot-classification")`` called once per entry
+for the main category and once more for the subcategory; every backend
+reports its agreement with it. An ONNX directory can be produced with
+``optimum-cli export onnx --model facebook/bart-large-mnli --task text-classification ./bart-mnli-onnx``.
+
+Entries are the labelled samples below (or a JSONL file with an ``entry``
+field and optional ``main_category``) plus ``--synthetic`` unlabelled entries
+from bench.py. Accuracy is measured on the labelled rows only; agreement
+with the pipeline covers all of them.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from bench import synthetic_entries
+from classifier import RobustJournalClassifier
+from model_loader import MODEL_NAME
+
+SAMPLES = [
+    ("I want to save R5000 for an emergency fund by December.", "Goals"),
+    ("Today I felt anxious and overwhelmed before the meeting.", "Emotions"),
+    ("Tomorrow I will go to the bank, then buy groceries for meal prep.", "Plans"),
+    ("Had dinner with my sister and we finally talked things through.", "Relationships"),
+    ("I keep procrastinating on my thesis and the deadline is close.", "Challenges"),
+    ("So thankful for my friends who showed up when I needed them.", "Gratitude"),
+    ("Slept only four hours again, my back hurts and I skipped the gym.", "Health"),
+    ("Day 12 of waking up at 6am and reading before touching my phone.", "Habits"),
+    ("Looking back, losing that job taught me to value my own time.", "Reflection"),
+    ("I'm going to learn Python properly and finish the data science course.", "Goals"),
+]
+
+
+class PipelineBaseline:
+    """The classifier as it was before the ZeroShotEngine backends: one pipeline call per label set."""
+
+    name = "pipeline"
+
+    def __init__(self, reference: RobustJournalClassifier):
+        self.category_desc = reference.category_desc
+        self.sub_map = reference.sub_map
+        self._pipe = None
+
+    def load(self):
+        from transformers import pipeline
+        try:
+            import torch
+            device = 0 if torch.cuda.is_available() else -1
+        except Exception:
+            device = -1
+        self._pipe = pipeline("zero-shot-classification", model=MODEL_NAME, device=device)
+
+    def classify_single(self, entry: str) -> str:
+        by_desc = {v: k for k, v in self.category_desc.items()}
+        out = self._pipe(entry.strip(), candidate_labels=list(self.category_desc.values()))
+        main_category = by_desc[out["labels"][0]]
+        if main_category in self.sub_map:
+            self._pipe(entry.strip(), candidate_labels=self.sub_map[main_category])
+        return main_category
+
+    def classify_batch(self, entries):
+        return [self.classify_single(e) for e in entries]
+
+
+class BackendRunner:
+    """A RobustJournalClassifier on one backend, reporting only the main category."""
+
+    def __init__(self, backend: str, model_path=None):
+        self.name = backend
+        self.clf = RobustJournalClassifier(backend=backend, model_path=model_path)
+
+    def load(self):
+        self.clf.warmup().join()
+        if self.clf.model_status() != "ready":
+            raise RuntimeError(f"{self.name}: {self.clf.model_status()}")
+
+    def classify_single(self, entry: str) -> str:
+        return self.clf.classify_single(entry).main_category
+
+    def classify_batch(self, entries):
+        return [r.main_category for r in self.clf.classify_batch(entries)]
+
+
+def load_samples(path):
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(r["entry"], r.get("main_category")) for r in rows]
+
+
+def bench(runner, samples, repeats):
+    t0 = time.time()
+    runner.load()
+    load_time = time.time() - t0
+
+    latencies, preds = [], []
+    for _ in range(repeats):
+        preds = []
+        for text, _label in samples:
+            t = time.perf_counter()
+            preds.append(runner.classify_single(text))
+            latencies.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    runner.classify_batch([text for text, _ in samples])
+    batch_time = time.perf_counter() - t
+
+    labelled = [(p, label) for p, (_, label) in zip(preds, samples) if label]
+    return {
+        "backend": runner.name,
+        "load_s": round(load_time, 2),
+        "latency_mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "batch_per_entry_ms": round(batch_time / len(samples) * 1000, 1),
+        "accuracy": round(sum(p == label for p, label in labelled) / len(labelled), 3) if labelled else None,
+        "predictions": preds,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backends", nargs="+", default=["pytorch", "quantized"])
+    ap.add_argument("--onnx-path", default=None)
+    ap.add_argument("--samples", default=None, help="JSONL file with entry (and optional main_category) rows")
+    ap.add_argument("--synthetic", type=int, default=100, help="unlabelled bench.py entries added to the samples")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeats", type=int, default=1)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    samples = load_samples(args.samples) if args.samples else list(SAMPLES)
+    samples += [(text, None) for text in synthetic_entries(args.synthetic, seed=args.seed)]
+    runners = [PipelineBaseline(RobustJournalClassifier())]
+    runners += [BackendRunner(backend, args.onnx_path if backend == "onnx" else None) for backend in args.backends]
+    results = [bench(runner, samples, args.repeats) for runner in runners]
+
+    baseline = results[0]["predictions"]
+    for r in results:
+        r["agreement_with_pipeline"] = round(sum(a == b for a, b in zip(r["predictions"], baseline)) / len(baseline), 3)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        extra = {k: v for k, v in r.items() if k not in ("backend", "predictions")}
+        print(r["backend"].ljust(10), "  ".join(f"{k}={v}" for k, v in extra.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# chunking.py
+"""Split long entries into sentence windows the NLI model can read in full.
+
+Offsets are returned instead of strings so callers can map chunk results back
+onto the original entry text.
+"""
+import re
+from typing import List, Tuple
+
+# A sentence runs up to terminal punctuation (plus closing quotes/brackets), a blank line or the end
+_SENTENCE = re.compile(r"\S.*?(?:[.!?]+[\"')\]]*(?=\s|$)|(?=\n\s*\n)|$)", re.S)
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the sentences in text, whitespace trimmed."""
+    spans = []
+    for m in _SENTENCE.finditer(text):
+        start, end = m.span()
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+    return spans
+
+
+def _split_long(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int]]:
+    """Cut a single over-long sentence at whitespace (or hard, if there is none)."""
+    pieces = []
+    while end - start > max_chars:
+        cut = text.rfind(" ", start + 1, start + max_chars + 1)
+        if cut <= start:
+            cut = start + max_chars
+        pieces.append((start, cut))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if end > start:
+        pieces.append((start, end))
+    return pieces
+
+
+def sentence_windows(text: str, max_chars: int = 1000, overlap: int = 0) -> List[Tuple[int, int]]:
+    """Group consecutive sentences into windows of at most max_chars characters.
+
+    ``overlap`` repeats the last n sentences of a window at the start of the
+    next one. The number of windows grows linearly with the length of text.
+    """
+    sentences = []
+    for start, end in split_sentences(text):
+        sentences.extend(_split_long(text, start, end, max_chars))
+    windows: List[Tuple[int, int]] = []
+    i = 0
+    while i < len(sentences):
+        j = i + 1
+        while j < len(sentences) and sentences[j][1] - sentences[i][0] <= max_chars:
+            j += 1
+        windows.append((sentences[i][0], sentences[j - 1][1]))
+        if j >= len(sentences):
+            break
+        i = max(j - overlap, i + 1)
+    return windows
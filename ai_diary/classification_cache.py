@@ -0,0 +1,78 @@
+# classification_cache.py
+import hashlib
+import time
+from json import dumps, loads
+from typing import Optional
+
+from classifier import ClassificationResult
+from database import DB_PATH, get_conn, transaction
+
+
+def normalize_entry(text: str) -> str:
+    """Whitespace-insensitive form of an entry used for cache keys."""
+    return " ".join(text.split())
+
+
+class ClassificationCache:
+    """Content-addressed, size-bounded LRU cache of classification results in SQLite.
+
+    Keys are a SHA-256 of the normalized entry text plus the classifier's
+    configuration key, so changing the model or labels never serves stale results.
+    Chunked results also keep the exact text, because their chunk offsets only
+    fit that string; a whitespace variant of a long entry is treated as a miss.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_entries: int = 5000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        get_conn(self.db_path).executescript("""
+        CREATE TABLE IF NOT EXISTS classification_cache (
+            cache_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            last_used REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_classification_cache_last_used ON classification_cache(last_used);
+        """)
+
+    @staticmethod
+    def make_key(entry: str, config_key: str) -> str:
+        return hashlib.sha256(f"{config_key}\0{normalize_entry(entry)}".encode("utf-8")).hexdigest()
+
+    def get(self, entry: str, config_key: str) -> Optional[ClassificationResult]:
+        key = self.make_key(entry, config_key)
+        row = get_conn(self.db_path).execute(
+            "SELECT result FROM classification_cache WHERE cache_key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        data = loads(row[0])
+        if data.get("chunks") and data.get("entry") != entry:
+            return None
+        with transaction(self.db_path) as t:
+            t.execute("UPDATE classification_cache SET last_used = ? WHERE cache_key = ?", (time.time(), key))
+        data.update(entry=entry, cached=True)
+        return ClassificationResult(**data)
+
+    def put(self, result: ClassificationResult, config_key: str):
+        if not result.success:
+            return
+        data = result.to_dict()
+        for k in ("cached", "stage_timings"):
+            data.pop(k, None)
+        if not data["chunks"]:
+            data.pop("entry")
+        with transaction(self.db_path) as t:
+            t.execute(
+                "INSERT OR REPLACE INTO classification_cache (cache_key, result, last_used) VALUES (?, ?, ?)",
+                (self.make_key(result.entry, config_key), dumps(data), time.time()),
+            )
+            # Evict least recently used rows beyond the size bound
+            t.execute("""
+            DELETE FROM classification_cache WHERE cache_key IN (
+                SELECT cache_key FROM classification_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """, (self.max_entries,))
+
+    def clear(self):
+        with transaction(self.db_path) as t:
+            t.execute("DELETE FROM classification_cache")
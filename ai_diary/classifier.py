@@ -1,13 +1,25 @@
 # classifier.py
+import hashlib
+import json
 import time
+import queue
+import threading
+from concurrent.futures import Future
 from dataclasses import dataclass, field
-from functools import lru_cache
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
 
+from chunking import sentence_windows
+from metrics import span, trace
+from model_loader import DEFAULT_BACKEND, DEFAULT_MODEL_PATH, MODEL_NAME, get_engine, model_status, warmup
+from zero_shot import HYPOTHESIS_TEMPLATE, ZeroShotEngine
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# How chunk scores of a long entry are combined into entry-level scores
+AGGREGATIONS = ("max", "mean", "length_weighted")
+
 @dataclass
 class ClassificationResult:
     entry: str
@@ -19,6 +31,18 @@ class ClassificationResult:
     processing_time: float = 0.0
     success: bool = True
     error_message: Optional[str] = None
+    cached: bool = False
+    # Milliseconds per stage (model_load, main_pass, sub_pass, ...); see metrics.py
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+    # Long entries only: one dict per sentence window with its start/end offsets
+    # into entry and its own main_category, sub_category and confidence
+    chunks: List[Dict] = field(default_factory=list)
+    # Raw entailment logit of every label scored, one dict per chunk (label -> logit),
+    # so results can be re-derived under new thresholds or labels (see diary_cli.py reclassify)
+    logits: List[Dict[str, float]] = field(default_factory=list)
+    # Classifier config_key() and scorer_key() the result was produced under
+    config_version: Optional[str] = None
+    scorer: Optional[str] = None
 
     def to_dict(self) -> Dict:
         """Return a dictionary representation of the classification result."""
@@ -31,15 +55,36 @@ class ClassificationResult:
             "sub_confidence": self.sub_confidence,
             "processing_time": self.processing_time,
             "success": self.success,
-            "error_message": self.error_message
+            "error_message": self.error_message,
+            "cached": self.cached,
+            "stage_timings": self.stage_timings,
+            "chunks": self.chunks,
+            "logits": self.logits,
+            "config_version": self.config_version,
+            "scorer": self.scorer
         }
 
 class RobustJournalClassifier:
-    def __init__(self, min_secondary_confidence=0.25, min_sub_confidence=0.35, max_entry_length=5000):
+    def __init__(self, min_secondary_confidence=0.25, min_sub_confidence=0.35, max_entry_length=None, joint=False, cache=None,
+                 backend=DEFAULT_BACKEND, model_path=DEFAULT_MODEL_PATH, chunk_chars=1000, aggregation="length_weighted"):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {aggregation!r}, expected one of {AGGREGATIONS}")
         self.min_secondary_confidence = min_secondary_confidence
         self.min_sub_confidence = min_sub_confidence
+        # None: no length limit; long entries are classified chunk by chunk
         self.max_entry_length = max_entry_length
-        self._pipe = None
+        # Entries longer than chunk_chars are split into sentence windows of at most
+        # that size (None disables chunking and the model truncates long inputs)
+        self.chunk_chars = chunk_chars
+        self.aggregation = aggregation
+        # joint=True scores main and every subcategory label in a single pass
+        self.joint = joint
+        # Optional ClassificationCache (see classification_cache.py)
+        self.cache = cache
+        # Model weights are shared process-wide through model_loader
+        self.backend = backend
+        self.model_path = model_path
+        self._engine = None
 
         self.category_desc = {
             "Reflection": "A personal reflection, insight, lesson learned, or thoughtful observation about life experiences",
@@ -65,60 +110,207 @@ class RobustJournalClassifier:
             "Reflection": ["Self-Awareness","Lesson Learned","Perspective Shift","Acceptance"]
         }
 
-    @lru_cache(maxsize=1)
-    def _get_pipe(self):
-        from transformers import pipeline
-        try:
-            import torch
-            device = 0 if torch.cuda.is_available() else -1
-        except Exception:
-            device = -1
-        logger.info("Loading zero-shot model…")
-        return pipeline("zero-shot-classification", model="facebook/bart-large-mnli", device=device, return_all_scores=True)
+    def warmup(self):
+        """Start loading the shared model in the background without blocking."""
+        return warmup(self.backend, self.model_path)
+
+    def model_status(self) -> str:
+        return model_status(self.backend, self.model_path)
+
+    def config(self) -> Dict:
+        """Everything that affects a classification result."""
+        return {
+            "model": self.model_path or MODEL_NAME,
+            "backend": self.backend,
+            "category_desc": self.category_desc,
+            "sub_map": self.sub_map,
+            "min_secondary_confidence": self.min_secondary_confidence,
+            "min_sub_confidence": self.min_sub_confidence,
+            "joint": self.joint,
+            "chunk_chars": self.chunk_chars,
+            "aggregation": self.aggregation,
+        }
+
+    def config_key(self) -> str:
+        """Hash of config(); recomputed on every call so changed thresholds or labels are picked up."""
+        return hashlib.sha256(json.dumps(self.config(), sort_keys=True).encode("utf-8")).hexdigest()
+
+    def scorer_key(self) -> str:
+        """Everything a stored logit depends on besides the entry and the label itself."""
+        return f"{self.backend}:{self.model_path or MODEL_NAME}:{HYPOTHESIS_TEMPLATE}:{self.chunk_chars}"
+
+    def _get_engine(self) -> ZeroShotEngine:
+        if self._engine is None:
+            with span("model_load"):
+                self._engine = get_engine(self.backend, self.model_path)
+        return self._engine
+
+    def embed(self, texts: List[str], batch_size: int = 16) -> List[List[float]]:
+        """Sentence vectors from the classifier's own encoder (no second model is loaded)."""
+        return self._get_engine().embed([t.strip() for t in texts], batch_size=batch_size)
 
     def _validate(self, entry: str) -> Tuple[bool, Optional[str]]:
         if not isinstance(entry, str) or not entry.strip():
             return False, "Entry cannot be empty"
-        if len(entry) > self.max_entry_length:
+        if self.max_entry_length is not None and len(entry) > self.max_entry_length:
             return False, f"Entry too long (>{self.max_entry_length} chars)"
         return True, None
 
+    def _to_short(self, desc: str) -> str:
+        for k, v in self.category_desc.items():
+            if v == desc:
+                return k
+        return "Unknown"
+
+    def _main_fields(self, out: Dict):
+        top2 = list(zip(out["labels"][:2], out["scores"][:2]))
+        mapped = [(self._to_short(d), float(s)) for d, s in top2]
+        main_category = mapped[0][0]
+        secondary_category = mapped[1][0] if len(mapped) > 1 and mapped[1][1] >= self.min_secondary_confidence else None
+        confidence_scores = {mc[0]: round(mc[1], 3) for mc in mapped}
+        return main_category, secondary_category, confidence_scores
+
+    def _sub_fields(self, sub_out: Optional[Dict]):
+        if sub_out is None:
+            return None, None
+        sub_label = sub_out["labels"][0]
+        sub_conf = float(sub_out["scores"][0])
+        if sub_conf < self.min_sub_confidence:
+            return None, None
+        return sub_label, sub_conf
+
+    def _fill(self, texts: List[str], logits: List[Dict[str, float]], needs: List[Tuple[int, List[str]]],
+              stage: str, batch_size: int = 32):
+        """Score the labels in needs that logits[k] does not have yet, in one batched pass."""
+        todo = [(k, [l for l in dict.fromkeys(labels) if l not in logits[k]]) for k, labels in needs]
+        todo = [(k, labels) for k, labels in todo if labels]
+        if not todo:
+            return
+        with span(stage):
+            rows = self._get_engine().entailment_logits([texts[k] for k, _ in todo], [labels for _, labels in todo],
+                                                        batch_size=batch_size)
+        for (k, labels), row in zip(todo, rows):
+            logits[k].update(zip(labels, row))
+
+    @staticmethod
+    def _group(logits: Dict[str, float], labels: List[str]) -> Dict:
+        return ZeroShotEngine.softmax(labels, [logits[l] for l in labels])
+
+    def _chunk_spans(self, entry: str) -> List[Tuple[int, int]]:
+        stripped = entry.strip()
+        if self.chunk_chars is None or len(stripped) <= self.chunk_chars:
+            start = len(entry) - len(entry.lstrip())
+            return [(start, start + len(stripped))]
+        return sentence_windows(entry, self.chunk_chars)
+
+    def _aggregate(self, outs: List[Dict], weights: List[float]) -> Dict:
+        """Combine pipeline-style outputs label by label into one, best label first."""
+        per_chunk = [dict(zip(o["labels"], o["scores"])) for o in outs]
+        labels = per_chunk[0].keys()
+        if self.aggregation == "max":
+            combined = {l: max(p[l] for p in per_chunk) for l in labels}
+        else:
+            if self.aggregation == "mean":
+                weights = [1.0] * len(per_chunk)
+            total = sum(weights)
+            combined = {l: sum(w * p[l] for w, p in zip(weights, per_chunk)) / total for l in labels}
+        ranked = sorted(combined.items(), key=lambda kv: kv[1], reverse=True)
+        return {"labels": [l for l, _ in ranked], "scores": [s for _, s in ranked]}
+
+    def _score_entries(self, entries: List[str], batch_size: int = 32,
+                       logits: Optional[List[List[Dict[str, float]]]] = None
+                       ) -> List[Tuple[Dict, Optional[Dict], List[Dict], List[Dict[str, float]]]]:
+        """Return (main_out, sub_out, chunks, logits) for each entry.
+
+        Entries longer than chunk_chars are split into sentence windows; the
+        windows of all entries are scored together in one batch and combined
+        with the configured aggregation. chunks is empty for short entries.
+
+        ``logits`` optionally holds per-chunk logits stored from an earlier run;
+        only labels missing from them are sent to the model, so re-deriving
+        results after a threshold change never loads the model.
+        """
+        spans = [self._chunk_spans(e) for e in entries]
+        texts = [e[s:t] for e, sp in zip(entries, spans) for s, t in sp]
+        flat: List[Dict[str, float]] = []
+        for i, sp in enumerate(spans):
+            stored = logits[i] if logits and len(logits[i]) == len(sp) else [{} for _ in sp]
+            flat.extend(dict(c) for c in stored)
+
+        cand = list(self.category_desc.values())
+        if self.joint:
+            every = cand + [l for labels in self.sub_map.values() for l in labels]
+            self._fill(texts, flat, [(k, every) for k in range(len(texts))], "joint_pass", batch_size)
+        else:
+            self._fill(texts, flat, [(k, cand) for k in range(len(texts))], "main_pass", batch_size)
+        mains = [self._group(l, cand) for l in flat]
+        chunk_mains = [self._to_short(m["labels"][0]) for m in mains]
+        self._fill(texts, flat, [(k, self.sub_map[m]) for k, m in enumerate(chunk_mains) if m in self.sub_map],
+                   "sub_pass", batch_size)
+        rows = [(m, self._group(l, self.sub_map[c]) if c in self.sub_map else None)
+                for m, l, c in zip(mains, flat, chunk_mains)]
+
+        out, missing, pos = [], [], 0
+        for entry, sp in zip(entries, spans):
+            first, pos = pos, pos + len(sp)
+            entry_rows = rows[first:pos]
+            if len(entry_rows) == 1:
+                out.append((entry_rows[0][0], entry_rows[0][1], [], flat[first:pos]))
+                continue
+            weights = [float(t - s) for s, t in sp]
+            main_out = self._aggregate([m for m, _ in entry_rows], weights)
+            main = self._to_short(main_out["labels"][0])
+            # Sub labels were only scored for windows whose own main category matches the entry's
+            same = [i for i, (m, sub) in enumerate(entry_rows) if sub is not None and self._to_short(m["labels"][0]) == main]
+            sub_out = None
+            if same:
+                sub_out = self._aggregate([entry_rows[i][1] for i in same], [weights[i] for i in same])
+            elif main in self.sub_map:
+                missing.append((len(out), first, weights, main))
+            chunks = []
+            for (s, t), (m, sub) in zip(sp, entry_rows):
+                chunk_main, _, chunk_conf = self._main_fields(m)
+                chunk_sub, _ = self._sub_fields(sub)
+                chunks.append({"start": s, "end": t, "main_category": chunk_main, "sub_category": chunk_sub,
+                               "confidence": chunk_conf[chunk_main]})
+            out.append((main_out, sub_out, chunks, flat[first:pos]))
+
+        if missing:
+            self._fill(texts, flat, [(first + j, self.sub_map[main]) for _, first, weights, main in missing
+                                     for j in range(len(weights))], "sub_pass", batch_size)
+            for idx, first, weights, main in missing:
+                main_out, _, chunks, entry_logits = out[idx]
+                subs = [self._group(flat[first + j], self.sub_map[main]) for j in range(len(weights))]
+                out[idx] = (main_out, self._aggregate(subs, weights), chunks, entry_logits)
+        return out
+
     def classify_single(self, entry: str) -> ClassificationResult:
+        with trace() as tr:
+            result = self._classify_single(entry)
+        result.stage_timings = tr.rounded()
+        return result
+
+    def _classify_single(self, entry: str) -> ClassificationResult:
         t0 = time.time()
         ok, msg = self._validate(entry)
         if not ok:
             return ClassificationResult(entry=entry, main_category="Unknown", secondary_category=None, success=False, error_message=msg)
 
-        try:
-            pipe = self._get_pipe()
-            cand = list(self.category_desc.values())
-            out = pipe(entry.strip(), candidate_labels=cand)
-
-            labels = out["labels"]
-            scores = out["scores"]
-            top2 = list(zip(labels[:2], scores[:2]))
-
-            def to_short(desc: str) -> str:
-                for k, v in self.category_desc.items():
-                    if v == desc:
-                        return k
-                return "Unknown"
+        if self.cache is not None:
+            with span("cache_lookup"):
+                hit = self.cache.get(entry, self.config_key())
+            if hit is not None:
+                hit.processing_time = time.time()-t0
+                return hit
 
-            mapped = [(to_short(d), float(s)) for d, s in top2]
-            main_category = mapped[0][0]
-            secondary_category = mapped[1][0] if len(mapped) > 1 and mapped[1][1] >= self.min_secondary_confidence else None
-            confidence_scores = {mc[0]: round(mc[1], 3) for mc in mapped}
+        try:
+            out, sub_out, chunks, logits = self._score_entries([entry])[0]
+            main_category, secondary_category, confidence_scores = self._main_fields(out)
 
             # Subcategory
-            sub_label, sub_conf = None, None
-            if main_category in self.sub_map:
-                sub_out = pipe(entry.strip(), candidate_labels=self.sub_map[main_category])
-                sub_label = sub_out["labels"][0]
-                sub_conf = float(sub_out["scores"][0])
-                if sub_conf < self.min_sub_confidence:
-                    sub_label, sub_conf = None, None
+            sub_label, sub_conf = self._sub_fields(sub_out)
 
-            return ClassificationResult(
+            result = ClassificationResult(
                 entry=entry,
                 main_category=main_category,
                 secondary_category=secondary_category,
@@ -126,8 +318,16 @@ class RobustJournalClassifier:
                 confidence_scores=confidence_scores,
                 sub_confidence=sub_conf,
                 processing_time=time.time()-t0,
-                success=True
+                success=True,
+                chunks=chunks,
+                logits=logits,
+                config_version=self.config_key(),
+                scorer=self.scorer_key()
             )
+            if self.cache is not None:
+                with span("cache_write"):
+                    self.cache.put(result, self.config_key())
+            return result
         except Exception as e:
             return ClassificationResult(
                 entry=entry,
@@ -136,4 +336,131 @@ class RobustJournalClassifier:
                 success=False,
                 error_message=str(e),
                 processing_time=time.time()-t0
-            )
\ No newline at end of file
+            )
+
+    def classify_batch(self, entries: List[str], batch_size: int = 32,
+                       logits: Optional[List[List[Dict[str, float]]]] = None) -> List[ClassificationResult]:
+        """Classify many entries with padded batched forward passes.
+
+        ``batch_size`` counts (premise, hypothesis) pairs per forward pass.
+        ``logits`` optionally gives each entry's stored per-chunk logits (the
+        ``logits`` field of an earlier result); only missing labels are scored.
+
+        Results are returned in input order and carry the same fields as
+        classify_single would produce for each entry; processing_time and
+        stage_timings are the batch totals amortized over the entries.
+        """
+        with trace() as tr:
+            results = self._classify_batch(entries, batch_size, logits)
+        share = {k: round(v / max(len(entries), 1), 3) for k, v in tr.spans.items()}
+        for r in results:
+            r.stage_timings = dict(share)
+        return results
+
+    def _classify_batch(self, entries: List[str], batch_size: int = 32,
+                        logits: Optional[List[List[Dict[str, float]]]] = None) -> List[ClassificationResult]:
+        t0 = time.time()
+        results: List[Optional[ClassificationResult]] = [None] * len(entries)
+        valid = []
+        for i, entry in enumerate(entries):
+            ok, msg = self._validate(entry)
+            with span("cache_lookup"):
+                hit = self.cache.get(entry, self.config_key()) if ok and self.cache is not None else None
+            if hit is not None:
+                results[i] = hit
+            elif ok:
+                valid.append(i)
+            else:
+                results[i] = ClassificationResult(entry=entry, main_category="Unknown", secondary_category=None, success=False, error_message=msg)
+        if not valid:
+            return results
+
+        try:
+            scored = self._score_entries([entries[i] for i in valid], batch_size=batch_size,
+                                         logits=[logits[i] for i in valid] if logits else None)
+            mains = {i: self._main_fields(out) for i, (out, _, _, _) in zip(valid, scored)}
+            sub_outs = {i: sub_out for i, (_, sub_out, _, _) in zip(valid, scored)}
+            chunks = {i: c for i, (_, _, c, _) in zip(valid, scored)}
+            entry_logits = {i: l for i, (_, _, _, l) in zip(valid, scored)}
+
+            elapsed = (time.time() - t0) / len(valid)
+            for i in valid:
+                main_category, secondary_category, confidence_scores = mains[i]
+                sub_label, sub_conf = self._sub_fields(sub_outs.get(i))
+                results[i] = ClassificationResult(
+                    entry=entries[i],
+                    main_category=main_category,
+                    secondary_category=secondary_category,
+                    sub_category=sub_label,
+                    confidence_scores=confidence_scores,
+                    sub_confidence=sub_conf,
+                    processing_time=elapsed,
+                    success=True,
+                    chunks=chunks[i],
+                    logits=entry_logits[i],
+                    config_version=self.config_key(),
+                    scorer=self.scorer_key()
+                )
+                if self.cache is not None:
+                    with span("cache_write"):
+                        self.cache.put(results[i], self.config_key())
+        except Exception as e:
+            elapsed = time.time() - t0
+            for i in valid:
+                results[i] = ClassificationResult(
+                    entry=entries[i],
+                    main_category="Unknown",
+                    secondary_category=None,
+                    success=False,
+                    error_message=str(e),
+                    processing_time=elapsed
+                )
+        return results
+
+
+class MicroBatcher:
+    """Coalesces concurrent classify_single calls into shared classify_batch passes.
+
+    Requests that arrive within ``max_wait_ms`` of the first queued request are
+    merged (up to ``max_batch_size``) and run through the model together.
+    """
+
+    def __init__(self, classifier: RobustJournalClassifier, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="classifier-microbatch", daemon=True)
+        self._worker.start()
+
+    def classify_single(self, entry: str) -> ClassificationResult:
+        fut: Future = Future()
+        self._queue.put((entry, fut))
+        return fut.result()
+
+    def classify_batch(self, entries: List[str], batch_size: int = 32) -> List[ClassificationResult]:
+        return self.classifier.classify_batch(entries, batch_size=batch_size)
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.classifier.classify_batch([e for e, _ in batch])
+                for (_, fut), res in zip(batch, results):
+                    fut.set_result(res)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
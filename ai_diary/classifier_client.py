@@ -0,0 +1,155 @@
+# classifier_client.py
+import http.client
+import json
+import logging
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from classifier import ClassificationResult
+
+logger = logging.getLogger(__name__)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ClassifierClient:
+    """Drop-in replacement for RobustJournalClassifier backed by classifier_server.py.
+
+    ``url`` is ``http://host:port`` or ``unix:///path/to.sock``. Requests the
+    server rejects as overloaded are retried up to ``retries`` times, honouring
+    Retry-After; after that (or if the server is unreachable) the call returns
+    failed ClassificationResults, as the local classifier does on model errors.
+
+    The label configuration (category_desc, sub_map, thresholds, ...) and the
+    config/scorer keys are the server's, read from /health and refreshed every
+    ``config_ttl`` seconds.
+    """
+
+    backend = "server"
+
+    def __init__(self, url: str, timeout: float = 120.0, retries: int = 3, config_ttl: float = 30.0):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            self._socket_path = parsed.path
+        elif parsed.scheme == "http":
+            self._socket_path = None
+            self._host, self._port = parsed.hostname, parsed.port or 80
+        else:
+            raise ValueError(f"Unsupported classifier URL {url!r}, expected http:// or unix://")
+        self.config_ttl = config_ttl
+        self._health: Optional[Dict] = None
+        self._health_at = 0.0
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._socket_path:
+            return _UnixHTTPConnection(self._socket_path, self.timeout)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None) -> Tuple[int, Dict]:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        for attempt in range(self.retries + 1):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                data = json.loads(resp.read() or b"{}")
+                if resp.status != 503 or attempt == self.retries:
+                    return resp.status, data
+                delay = float(resp.getheader("Retry-After", 1))
+            finally:
+                conn.close()
+            time.sleep(delay * (attempt + 1))
+        raise AssertionError("unreachable")
+
+    def _post(self, path: str, payload: Dict) -> Dict:
+        status, data = self._request("POST", path, payload)
+        if status == 501:
+            raise NotImplementedError(data.get("error"))
+        if status != 200:
+            raise RuntimeError(f"classifier server returned {status}: {data.get('error')}")
+        return data
+
+    # ------------------ RobustJournalClassifier interface ------------------
+
+    def warmup(self):
+        """The server loads its model at startup; nothing to do here."""
+        return None
+
+    def model_status(self) -> str:
+        try:
+            status, data = self._request("GET", "/health")
+        except OSError as e:
+            return f"failed: classifier server unreachable ({e})"
+        return data.get("status", f"failed: HTTP {status}")
+
+    def _server_config(self) -> Dict:
+        if self._health is None or time.monotonic() - self._health_at > self.config_ttl:
+            try:
+                status, data = self._request("GET", "/health")
+                if status != 200 or "config" not in data:
+                    raise RuntimeError(f"classifier server returned {status} for /health")
+            except (OSError, RuntimeError, ValueError):
+                # Keep serving the last known config while the server is briefly away
+                if self._health is None:
+                    raise
+                logger.warning("Could not refresh the classifier config from %s", self.url)
+                return self._health
+            self._health, self._health_at = data, time.monotonic()
+        return self._health
+
+    def __getattr__(self, name: str):
+        # category_desc, sub_map, min_secondary_confidence, ... as configured on the server
+        if name.startswith("_"):
+            raise AttributeError(name)
+        config = self._server_config()["config"]
+        if name not in config:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        return config[name]
+
+    def config(self) -> Dict:
+        return self._server_config()["config"]
+
+    def config_key(self) -> str:
+        return self._server_config()["config_key"]
+
+    def scorer_key(self) -> str:
+        return self._server_config()["scorer_key"]
+
+    def classify_single(self, entry: str) -> ClassificationResult:
+        t0 = time.time()
+        try:
+            return ClassificationResult(**self._post("/classify", {"entry": entry}))
+        except (OSError, RuntimeError, ValueError) as e:
+            return ClassificationResult(entry=entry, main_category="Unknown", success=False,
+                                        error_message=str(e), processing_time=time.time() - t0)
+
+    def classify_batch(self, entries: List[str], batch_size: int = 32,
+                       logits: Optional[List[List[Dict[str, float]]]] = None) -> List[ClassificationResult]:
+        t0 = time.time()
+        payload = {"entries": list(entries)}
+        if logits is not None:
+            payload["logits"] = list(logits)
+        try:
+            data = self._post("/classify_batch", payload)
+            return [ClassificationResult(**r) for r in data["results"]]
+        except (OSError, RuntimeError, ValueError) as e:
+            elapsed = time.time() - t0
+            return [ClassificationResult(entry=entry, main_category="Unknown", success=False,
+                                         error_message=str(e), processing_time=elapsed) for entry in entries]
+
+    def embed(self, texts: List[str], batch_size: int = 16) -> List[List[float]]:
+        return self._post("/embed", {"texts": list(texts)})["vectors"]
@@ -0,0 +1,367 @@
+# classifier_server.py
+"""Standalone classifier service: one model in memory for any number of UI processes.
+
+    python classifier_server.py --port 8765 --workers 2
+    python classifier_server.py --socket /tmp/diary-classifier.sock
+
+The model is loaded once in the server process; inference workers are then
+forked from it, so they share the weights copy-on-write, and each is pinned
+to its own set of CPU cores. Concurrent requests are coalesced into shared
+batches. When more than ``max_pending`` entries are waiting, new requests get
+503 with Retry-After instead of queueing without bound.
+
+Endpoints (JSON over HTTP, on localhost or a Unix socket):
+    POST /classify        {"entry": str}            -> ClassificationResult dict
+    POST /classify_batch  {"entries": [str], "logits": [[{label: float}]]?}
+                                                    -> {"results": [dict]}
+    POST /embed           {"texts": [str]}          -> {"vectors": [[float]]}
+    GET  /health          -> {"status", "config_key", "scorer_key", "config", "backend", "workers", "pending"}
+
+``logits`` passes each entry's stored per-chunk logits (see
+RobustJournalClassifier.classify_batch), so only missing labels are scored.
+
+Clients use ClassifierClient from classifier_client.py.
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from classifier import RobustJournalClassifier
+from model_loader import BACKENDS, DEFAULT_BACKEND, DEFAULT_MODEL_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+# "rescore" items are JSON [entry, logits] pairs, so they batch and deduplicate like plain text
+KINDS = ("classify", "rescore", "embed")
+
+
+class Overloaded(Exception):
+    """Raised by ClassifierServer.submit when the pending queue is full."""
+
+
+def _worker_main(classifier: RobustJournalClassifier, cores: Optional[List[int]], tasks, results):
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+        try:
+            import torch
+            torch.set_num_threads(len(cores))
+        except ImportError:
+            pass
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        batch_id, kind, items = task
+        try:
+            if kind == "classify":
+                out = [r.to_dict() for r in classifier.classify_batch(items)]
+            elif kind == "rescore":
+                pairs = [json.loads(item) for item in items]
+                out = [r.to_dict() for r in classifier.classify_batch([entry for entry, _ in pairs],
+                                                                      logits=[logits for _, logits in pairs])]
+            else:
+                out = [[float(x) for x in v] for v in classifier.embed(items)]
+            results.put((batch_id, out, None))
+        except Exception as e:
+            results.put((batch_id, None, (type(e).__name__, str(e))))
+
+
+def core_sets(workers: int, cpus: Optional[List[int]] = None) -> List[List[int]]:
+    """Split the usable CPUs into one disjoint, contiguous set per worker."""
+    if cpus is None:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    per = max(1, len(cpus) // workers)
+    return [cpus[(i * per) % len(cpus):][:per] for i in range(workers)]
+
+
+class ClassifierServer:
+    """Coalescing dispatcher in front of a pool of forked inference workers.
+
+    ``submit`` returns a Future per request. A dispatcher thread merges queued
+    requests of the same kind (up to ``max_batch_size`` items, waiting at most
+    ``max_wait_ms`` after the first) into one batch, drops duplicate texts and
+    hands the batch to the next idle worker.
+    """
+
+    def __init__(self, classifier: RobustJournalClassifier, workers: int = 1, max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, max_pending: int = 512, pin_cores: bool = True):
+        self.classifier = classifier
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pending = max_pending
+        self.cores = core_sets(workers) if pin_cores else [None] * workers
+        self._ctx = multiprocessing.get_context("fork")
+        self._requests: "queue.Queue[Tuple[str, List[str], Future]]" = queue.Queue()
+        self._carry: Optional[Tuple[str, List[str], Future]] = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._idle: "queue.Queue[int]" = queue.Queue()
+        self._results = self._ctx.Queue()
+        self._procs: List = [None] * workers
+        self._tasks: List = [None] * workers
+        # worker index -> (batch_id, [(future, start, end)], item index map)
+        self._inflight: Dict[int, Tuple[int, List[Tuple[Future, int, int]], List[int]]] = {}
+        self._inflight_lock = threading.Lock()
+        self._batch_ids = itertools.count()
+        self._stop = threading.Event()
+
+    def start(self) -> "ClassifierServer":
+        # Load in this process before forking so the workers share one copy of the weights
+        self.classifier._get_engine()
+        for i in range(self.workers):
+            self._spawn(i)
+        for target, name in ((self._dispatch, "dispatch"), (self._collect, "collect")):
+            threading.Thread(target=target, name=f"classifier-{name}", daemon=True).start()
+        return self
+
+    def _spawn(self, i: int, idle: bool = True):
+        self._tasks[i] = self._ctx.Queue()
+        self._procs[i] = self._ctx.Process(target=_worker_main, name=f"classifier-worker-{i}", daemon=True,
+                                           args=(self.classifier, self.cores[i], self._tasks[i], self._results))
+        self._procs[i].start()
+        if idle:
+            self._idle.put(i)
+        logger.info("Worker %d started (pid %s, cores %s)", i, self._procs[i].pid, self.cores[i])
+
+    def stop(self):
+        self._stop.set()
+        for tasks in self._tasks:
+            tasks.put(None)
+        for proc in self._procs:
+            proc.join(5)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def alive_workers(self) -> int:
+        return sum(1 for p in self._procs if p is not None and p.is_alive())
+
+    def submit(self, kind: str, items: List[str]) -> Future:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown request kind {kind!r}")
+        with self._pending_lock:
+            if self._pending and self._pending + len(items) > self.max_pending:
+                raise Overloaded(f"{self._pending} items pending")
+            self._pending += len(items)
+        fut: Future = Future()
+        self._requests.put((kind, items, fut))
+        return fut
+
+    def _next_request(self, timeout: Optional[float]):
+        if self._carry is not None:
+            req, self._carry = self._carry, None
+            return req
+        return self._requests.get(timeout=timeout)
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            worker = self._idle.get()
+            # Requests keep accumulating while every worker is busy, so batches grow under load
+            first = self._next_request(None)
+            batch = [first]
+            size = len(first[1])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    req = self._next_request(remaining)
+                except queue.Empty:
+                    break
+                if req[0] != first[0] or size + len(req[1]) > self.max_batch_size:
+                    self._carry = req
+                    break
+                batch.append(req)
+                size += len(req[1])
+            self._send(worker, first[0], batch)
+
+    def _send(self, worker: int, kind: str, batch: List[Tuple[str, List[str], Future]]):
+        unique: Dict[str, int] = {}
+        index, parts, offset = [], [], 0
+        for _, items, fut in batch:
+            for item in items:
+                index.append(unique.setdefault(item, len(unique)))
+            parts.append((fut, offset, offset + len(items)))
+            offset += len(items)
+        batch_id = next(self._batch_ids)
+        with self._inflight_lock:
+            self._inflight[worker] = (batch_id, parts, index)
+        self._tasks[worker].put((batch_id, kind, list(unique)))
+
+    def _finish(self, worker: int, out: Optional[List], error: Optional[Tuple[str, str]]):
+        with self._inflight_lock:
+            _, parts, index = self._inflight.pop(worker)
+        with self._pending_lock:
+            self._pending -= len(index)
+        for fut, start, end in parts:
+            if error is not None:
+                fut.set_exception(NotImplementedError(error[1]) if error[0] == "NotImplementedError"
+                                  else RuntimeError(f"{error[0]}: {error[1]}"))
+            else:
+                fut.set_result([out[j] for j in index[start:end]])
+        self._idle.put(worker)
+
+    def _collect(self):
+        while not self._stop.is_set():
+            try:
+                batch_id, out, error = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._reap()
+                continue
+            with self._inflight_lock:
+                worker = next((w for w, v in self._inflight.items() if v[0] == batch_id), None)
+            if worker is not None:
+                self._finish(worker, out, error)
+
+    def _reap(self):
+        """Fail the batch of any worker that died and start a replacement."""
+        for i, proc in enumerate(self._procs):
+            if proc.is_alive() or self._stop.is_set():
+                continue
+            logger.error("Worker %d exited with code %s; restarting", i, proc.exitcode)
+            # An idle worker's slot is still in the idle queue; a busy one gets it back from _finish
+            self._spawn(i, idle=False)
+            with self._inflight_lock:
+                busy = i in self._inflight
+            if busy:
+                self._finish(i, None, ("WorkerDied", f"worker exited with code {proc.exitcode}"))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server: ClassifierServer = self.server.classifier_server
+        if self.path != "/health":
+            self._reply(404, {"error": "not found"})
+            return
+        alive = server.alive_workers()
+        classifier = server.classifier
+        self._reply(200, {"status": "ready" if alive else "failed: no live workers",
+                          "config_key": classifier.config_key(), "scorer_key": classifier.scorer_key(),
+                          "config": classifier.config(), "backend": classifier.backend,
+                          "workers": alive, "pending": server.pending})
+
+    def do_POST(self):
+        server: ClassifierServer = self.server.classifier_server
+        routes = {"/classify": ("classify", "entry"), "/classify_batch": ("classify", "entries"),
+                  "/embed": ("embed", "texts")}
+        if self.path not in routes:
+            self._reply(404, {"error": "not found"})
+            return
+        kind, field = routes[self.path]
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            items = [body[field]] if self.path == "/classify" else list(body[field])
+            if not all(isinstance(x, str) for x in items):
+                raise TypeError(f"{field} must be text")
+            if body.get("logits") is not None and self.path == "/classify_batch":
+                if len(body["logits"]) != len(items):
+                    raise ValueError("logits must have one list per entry")
+                kind = "rescore"
+                items = [json.dumps([item, logits], sort_keys=True) for item, logits in zip(items, body["logits"])]
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {"error": f"bad request: {e}"})
+            return
+        try:
+            out = server.submit(kind, items).result() if items else []
+        except Overloaded as e:
+            self._reply(503, {"error": f"overloaded: {e}"}, {"Retry-After": "1"})
+            return
+        except NotImplementedError as e:
+            self._reply(501, {"error": str(e)})
+            return
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        if self.path == "/classify":
+            self._reply(200, out[0])
+        else:
+            self._reply(200, {"vectors" if kind == "embed" else "results": out})
+
+    def log_message(self, *args):
+        pass
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(server: ClassifierServer, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+          socket_path: Optional[str] = None):
+    """Expose a started ClassifierServer over HTTP; returns the (not yet serving) HTTP server."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        httpd = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        httpd = _HTTPServer((host, port), _Handler)
+    httpd.classifier_server = server
+    return httpd
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--socket", default=None, help="serve on this Unix socket instead of TCP")
+    ap.add_argument("--workers", type=int, default=1, help="inference worker processes")
+    ap.add_argument("--no-pin", action="store_true", help="do not pin workers to CPU cores")
+    ap.add_argument("--max-batch-size", type=int, default=32)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    ap.add_argument("--max-pending", type=int, default=512, help="queued entries before answering 503")
+    ap.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    ap.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    ap.add_argument("--cache-db", default=None, help="SQLite file for the classification cache")
+    args = ap.parse_args(argv)
+
+    cache = None
+    if args.cache_db:
+        from classification_cache import ClassificationCache
+        from database import close_conns
+        cache = ClassificationCache(args.cache_db)
+        close_conns()  # workers open their own connections after the fork
+    classifier = RobustJournalClassifier(cache=cache, backend=args.backend, model_path=args.model_path)
+    server = ClassifierServer(classifier, workers=args.workers, max_batch_size=args.max_batch_size,
+                              max_wait_ms=args.max_wait_ms, max_pending=args.max_pending,
+                              pin_cores=not args.no_pin).start()
+    httpd = serve(server, args.host, args.port, args.socket)
+    logger.info("Classifier server listening on %s", args.socket or f"http://{args.host}:{args.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
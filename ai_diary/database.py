@@ -1,235 +1,1390 @@
 # database.py
+import os
+import re
 import sqlite3
-from json import dumps, loads
-from typing import Dict, List, Optional
+import struct
+import threading
+from collections import OrderedDict
+from json import loads
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 
 from classifier import ClassificationResult
 from goal_logic import extract_goals_from_text, detect_goal_completion_mentions
+from metrics import span
 
 DB_PATH = "diary.db"
+DEFAULT_USER_ID = 1
+# When set, each user's data lives in its own file under this directory (see ShardRouter)
+SHARD_DIR = os.environ.get("DIARY_SHARD_DIR") or None
+# Per-thread cap on open connections; the least recently used idle ones are closed first
+MAX_OPEN_CONNS = int(os.environ.get("DIARY_MAX_OPEN_CONNS", "64"))
 
-def get_conn(db_path: str = DB_PATH):
-    return sqlite3.connect(db_path)
+# Applied to every pooled connection. WAL lets readers run alongside one writer,
+# and busy_timeout makes concurrent writers wait instead of failing with "database is locked".
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 30000,
+    "cache_size": -32000,      # KiB, i.e. ~32 MB page cache
+    "mmap_size": 268435456,    # 256 MB
+    "temp_store": "MEMORY",
+}
+
+_local = threading.local()
+
+def _pool() -> "OrderedDict[str, sqlite3.Connection]":
+    if not hasattr(_local, "conns"):
+        _local.conns = OrderedDict()
+        _local.active = {}
+    return _local.conns
+
+def get_conn(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """Return this thread's pooled connection to db_path, opening it on first use."""
+    conns = _pool()
+    conn = conns.get(db_path)
+    if conn is None:
+        # Autocommit mode: transactions are opened explicitly by Transaction
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        for name, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        conns[db_path] = conn
+        _evict(conns)
+    else:
+        conns.move_to_end(db_path)
+    return conn
+
+def _evict(conns: "OrderedDict[str, sqlite3.Connection]"):
+    """Close least recently used connections beyond MAX_OPEN_CONNS, skipping any inside a transaction."""
+    for path in list(conns):
+        if len(conns) <= MAX_OPEN_CONNS:
+            break
+        if path not in _local.active:
+            conns.pop(path).close()
+
+def close_conns():
+    """Close every pooled connection owned by the calling thread."""
+    conns = _pool()
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+    _local.active.clear()
+
+class Transaction:
+    """Unit of work on a pooled connection.
+
+    Nested ``with`` blocks on the same transaction share it and only the
+    outermost block commits (or rolls back on error). BEGIN IMMEDIATE takes
+    the write lock up front so concurrent writers queue on busy_timeout.
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.conn = get_conn(db_path)
+        self.depth = 0
+
+    def __enter__(self) -> "Transaction":
+        if self.depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+            _local.active[self.db_path] = self
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.depth -= 1
+        if self.depth == 0:
+            _local.active.pop(self.db_path, None)
+            if exc_type is None:
+                with span("db_commit"):
+                    self.conn.execute("COMMIT")
+            else:
+                self.conn.execute("ROLLBACK")
+        return False
+
+    def cursor(self) -> sqlite3.Cursor:
+        return self.conn.cursor()
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self.conn.execute(sql, params)
+
+def transaction(db_path: str = DB_PATH) -> Transaction:
+    """Return the thread's open transaction on db_path, or a new one."""
+    _pool()
+    return _local.active.get(db_path) or Transaction(db_path)
+
+def _reader(db_path: str, tx: Optional[Transaction]) -> sqlite3.Connection:
+    return tx.conn if tx is not None else get_conn(db_path)
 
 # ------------------ Initialization ------------------
 
+# The original (version 0) schema; MIGRATIONS reshape it from there
+BASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS entries (
+    entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    entry_text TEXT NOT NULL,
+    main_category TEXT NOT NULL,
+    secondary_category TEXT,
+    sub_category TEXT,
+    confidence_scores TEXT,
+    success BOOLEAN NOT NULL DEFAULT 1,
+    error_message TEXT,
+    processing_time REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS tags (
+    tag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    FOREIGN KEY (entry_id) REFERENCES entries(entry_id)
+);
+
+CREATE TABLE IF NOT EXISTS goals (
+    goal_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    goal_text TEXT NOT NULL,
+    category TEXT,
+    sub_category TEXT,
+    status TEXT NOT NULL DEFAULT 'planned',
+    target_amount REAL,
+    current_amount REAL DEFAULT 0,
+    due_date TEXT,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS goal_links (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    goal_id INTEGER NOT NULL,
+    entry_id INTEGER NOT NULL,
+    link_type TEXT NOT NULL DEFAULT 'reference',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (goal_id) REFERENCES goals(goal_id),
+    FOREIGN KEY (entry_id) REFERENCES entries(entry_id)
+);
+"""
+
 def init_db(db_path: str = DB_PATH):
     conn = get_conn(db_path)
     cur = conn.cursor()
-    cur.executescript("""
-    PRAGMA foreign_keys = ON;
+    # Base schema; migrations reshape it later (10 replaces tags), so it is only created in a fresh database
+    if schema_version(db_path) == 0:
+        cur.executescript(BASE_SCHEMA)
+    # Ensure default user exists
+    cur.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (DEFAULT_USER_ID, "default_user"))
+    migrate(db_path)
 
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL UNIQUE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
+# ------------------ Users & Shards ------------------
+
+def get_or_create_user(username: str, db_path: str = DB_PATH) -> int:
+    """user_id for username, registering it on first sight."""
+    username = username.strip()
+    if not username:
+        raise ValueError("username cannot be empty")
+    row = get_conn(db_path).execute("SELECT user_id FROM users WHERE username = ?", (username,)).fetchone()
+    if row:
+        return row[0]
+    with transaction(db_path) as t:
+        t.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+        user_id = t.execute("SELECT user_id FROM users WHERE username = ?", (username,)).fetchone()[0]
+    return user_id
 
-    CREATE TABLE IF NOT EXISTS entries (
-        entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+class ShardRouter:
+    """Maps a user to the database file that holds their entries and goals.
+
+    Without ``shard_dir`` every user lives in ``db_path``. With it, each user
+    gets ``shard_dir/user_<id>.db`` (created on first use), so users never
+    contend for one write lock; ``db_path`` then keeps the users directory,
+    the ingestion queue and the classification cache.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, shard_dir: Optional[str] = SHARD_DIR):
+        self.db_path = db_path
+        self.shard_dir = shard_dir
+        self._ready = set()
+        self._lock = threading.Lock()
+
+    @property
+    def sharded(self) -> bool:
+        return self.shard_dir is not None
+
+    def path(self, user_id: int) -> str:
+        if not self.sharded:
+            return self.db_path
+        path = os.path.join(self.shard_dir, f"user_{int(user_id)}.db")
+        if path not in self._ready:
+            with self._lock:
+                if path not in self._ready:
+                    os.makedirs(self.shard_dir, exist_ok=True)
+                    init_db(path)
+                    self._ready.add(path)
+        return path
+
+# ------------------ Migrations ------------------
+
+_COMPACT_STORAGE_BEFORE = """
+CREATE TABLE IF NOT EXISTS labels (
+    label_id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS entry_tags (
+    entry_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    label_id INTEGER NOT NULL,
+    PRIMARY KEY (entry_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entry_tags_label ON entry_tags(label_id, entry_id);
+
+INSERT OR IGNORE INTO labels (label) SELECT DISTINCT tag FROM tags;
+INSERT INTO entry_tags (entry_id, position, label_id)
+SELECT t.entry_id, ROW_NUMBER() OVER (PARTITION BY t.entry_id ORDER BY t.first_id) - 1, l.label_id
+FROM (SELECT entry_id, tag, MIN(tag_id) AS first_id FROM tags GROUP BY entry_id, tag) t
+JOIN labels l ON l.label = t.tag;
+
+DROP TRIGGER IF EXISTS entries_stats_ai;
+DROP TRIGGER IF EXISTS entries_stats_ad;
+DROP TRIGGER IF EXISTS entries_stats_au;
+
+ALTER TABLE entries ADD COLUMN scores BLOB;
+ALTER TABLE entries ADD COLUMN main_confidence REAL NOT NULL DEFAULT 0;
+UPDATE entries SET main_confidence = CASE WHEN json_valid(confidence_scores)
+    THEN COALESCE(json_extract(confidence_scores, '$."' || main_category || '"'), 0) ELSE 0 END;
+"""
+
+_COMPACT_STORAGE_AFTER = """
+CREATE TRIGGER IF NOT EXISTS entries_stats_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO daily_category_stats (user_id, day, main_category, sub_category, entry_count, confidence_sum)
+    VALUES (new.user_id, date(new.created_at), new.main_category, COALESCE(new.sub_category, ''), 1, new.main_confidence)
+    ON CONFLICT (user_id, day, main_category, sub_category) DO UPDATE SET
+        entry_count = entry_count + 1, confidence_sum = confidence_sum + excluded.confidence_sum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_stats_ad AFTER DELETE ON entries BEGIN
+    UPDATE daily_category_stats SET
+        entry_count = entry_count - 1, confidence_sum = confidence_sum - old.main_confidence
+    WHERE user_id = old.user_id AND day = date(old.created_at)
+      AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '');
+    DELETE FROM daily_category_stats
+    WHERE user_id = old.user_id AND day = date(old.created_at)
+      AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '')
+      AND entry_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_stats_au
+AFTER UPDATE OF user_id, main_category, sub_category, main_confidence, created_at ON entries BEGIN
+    UPDATE daily_category_stats SET
+        entry_count = entry_count - 1, confidence_sum = confidence_sum - old.main_confidence
+    WHERE user_id = old.user_id AND day = date(old.created_at)
+      AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '');
+    DELETE FROM daily_category_stats
+    WHERE user_id = old.user_id AND day = date(old.created_at)
+      AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '')
+      AND entry_count <= 0;
+    INSERT INTO daily_category_stats (user_id, day, main_category, sub_category, entry_count, confidence_sum)
+    VALUES (new.user_id, date(new.created_at), new.main_category, COALESCE(new.sub_category, ''), 1, new.main_confidence)
+    ON CONFLICT (user_id, day, main_category, sub_category) DO UPDATE SET
+        entry_count = entry_count + 1, confidence_sum = confidence_sum + excluded.confidence_sum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_tags_ad AFTER DELETE ON entries BEGIN
+    DELETE FROM entry_tags WHERE entry_id = old.entry_id;
+END;
+
+DROP TABLE tags;
+ALTER TABLE entries DROP COLUMN confidence_scores;
+"""
+
+def _compact_storage(t: "Transaction", chunk_size: int = 5000):
+    """Intern category names in labels, turn tags into integer references and the JSON
+    confidence_scores into packed entries.scores, and feed the rollups from main_confidence."""
+    for stmt in _statements(_COMPACT_STORAGE_BEFORE):
+        t.execute(stmt)
+    cur = t.execute("SELECT entry_id, confidence_scores FROM entries WHERE json_valid(confidence_scores)")
+    while True:
+        rows = [(entry_id, loads(scores)) for entry_id, scores in cur.fetchmany(chunk_size)]
+        if not rows:
+            break
+        writer = t.cursor()
+        ids = _label_ids(writer, [label for _, scores in rows for label in scores])
+        writer.executemany("UPDATE entries SET scores = ? WHERE entry_id = ?",
+                           [(_pack_scores(scores, ids), entry_id) for entry_id, scores in rows])
+    for stmt in _statements(_COMPACT_STORAGE_AFTER):
+        t.execute(stmt)
+
+# Each step upgrades the schema by one version (tracked in PRAGMA user_version): a SQL
+# script, or a function taking the Transaction when a step needs Python.
+# Append new steps; never edit one that has shipped.
+MIGRATIONS = [
+    # 1: secondary indexes for the entry, tag, goal and goal-link hot paths
+    """
+    CREATE INDEX IF NOT EXISTS idx_tags_entry_id ON tags(entry_id);
+    CREATE INDEX IF NOT EXISTS idx_entries_user_created ON entries(user_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_goals_user_status_created ON goals(user_id, status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_goal_links_goal_id ON goal_links(goal_id);
+    CREATE INDEX IF NOT EXISTS idx_goal_links_entry_id ON goal_links(entry_id);
+    """,
+    # 2: full-text index over goal_text, kept in sync with goals by triggers
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS goals_fts USING fts5(
+        goal_text, content='goals', content_rowid='goal_id', tokenize='porter unicode61'
+    );
+    CREATE TRIGGER IF NOT EXISTS goals_fts_ai AFTER INSERT ON goals BEGIN
+        INSERT INTO goals_fts(rowid, goal_text) VALUES (new.goal_id, new.goal_text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS goals_fts_ad AFTER DELETE ON goals BEGIN
+        INSERT INTO goals_fts(goals_fts, rowid, goal_text) VALUES ('delete', old.goal_id, old.goal_text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS goals_fts_au AFTER UPDATE OF goal_text ON goals BEGIN
+        INSERT INTO goals_fts(goals_fts, rowid, goal_text) VALUES ('delete', old.goal_id, old.goal_text);
+        INSERT INTO goals_fts(rowid, goal_text) VALUES (new.goal_id, new.goal_text);
+    END;
+    INSERT INTO goals_fts(goals_fts) VALUES ('rebuild');
+    """,
+    # 3: keyset pagination with category and status filters
+    """
+    CREATE INDEX IF NOT EXISTS idx_entries_user_category_created ON entries(user_id, main_category, created_at);
+    CREATE INDEX IF NOT EXISTS idx_goals_user_created ON goals(user_id, created_at);
+    """,
+    # 4: durable ingestion queue (see ingestion.py)
+    """
+    CREATE TABLE IF NOT EXISTS ingest_jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER NOT NULL,
         entry_text TEXT NOT NULL,
-        main_category TEXT NOT NULL,
-        secondary_category TEXT,
-        sub_category TEXT,
-        confidence_scores TEXT,
-        success BOOLEAN NOT NULL DEFAULT 1,
+        status TEXT NOT NULL DEFAULT 'pending',
+        entry_id INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
         error_message TEXT,
-        processing_time REAL,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(user_id)
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id),
+        FOREIGN KEY (entry_id) REFERENCES entries(entry_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status, job_id);
+    """,
+    # 5: resumable bulk imports (see diary_cli.py)
+    """
+    CREATE TABLE IF NOT EXISTS import_checkpoints (
+        source TEXT PRIMARY KEY,
+        records INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+    """,
+    # 6: analytics rollups, maintained incrementally by triggers on every write path
+    """
+    CREATE TABLE IF NOT EXISTS daily_category_stats (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        main_category TEXT NOT NULL,
+        sub_category TEXT NOT NULL DEFAULT '',
+        entry_count INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, main_category, sub_category)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS goal_status_stats (
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        goal_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, status)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS entries_stats_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO daily_category_stats (user_id, day, main_category, sub_category, entry_count, confidence_sum)
+        VALUES (new.user_id, date(new.created_at), new.main_category, COALESCE(new.sub_category, ''), 1,
+                CASE WHEN json_valid(new.confidence_scores)
+                     THEN COALESCE(json_extract(new.confidence_scores, '$."' || new.main_category || '"'), 0) ELSE 0 END)
+        ON CONFLICT (user_id, day, main_category, sub_category) DO UPDATE SET
+            entry_count = entry_count + 1, confidence_sum = confidence_sum + excluded.confidence_sum;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS entries_stats_ad AFTER DELETE ON entries BEGIN
+        UPDATE daily_category_stats SET
+            entry_count = entry_count - 1,
+            confidence_sum = confidence_sum - CASE WHEN json_valid(old.confidence_scores)
+                THEN COALESCE(json_extract(old.confidence_scores, '$."' || old.main_category || '"'), 0) ELSE 0 END
+        WHERE user_id = old.user_id AND day = date(old.created_at)
+          AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '');
+        DELETE FROM daily_category_stats
+        WHERE user_id = old.user_id AND day = date(old.created_at)
+          AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '')
+          AND entry_count <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS entries_stats_au
+    AFTER UPDATE OF user_id, main_category, sub_category, confidence_scores, created_at ON entries BEGIN
+        UPDATE daily_category_stats SET
+            entry_count = entry_count - 1,
+            confidence_sum = confidence_sum - CASE WHEN json_valid(old.confidence_scores)
+                THEN COALESCE(json_extract(old.confidence_scores, '$."' || old.main_category || '"'), 0) ELSE 0 END
+        WHERE user_id = old.user_id AND day = date(old.created_at)
+          AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '');
+        DELETE FROM daily_category_stats
+        WHERE user_id = old.user_id AND day = date(old.created_at)
+          AND main_category = old.main_category AND sub_category = COALESCE(old.sub_category, '')
+          AND entry_count <= 0;
+        INSERT INTO daily_category_stats (user_id, day, main_category, sub_category, entry_count, confidence_sum)
+        VALUES (new.user_id, date(new.created_at), new.main_category, COALESCE(new.sub_category, ''), 1,
+                CASE WHEN json_valid(new.confidence_scores)
+                     THEN COALESCE(json_extract(new.confidence_scores, '$."' || new.main_category || '"'), 0) ELSE 0 END)
+        ON CONFLICT (user_id, day, main_category, sub_category) DO UPDATE SET
+            entry_count = entry_count + 1, confidence_sum = confidence_sum + excluded.confidence_sum;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS goals_stats_ai AFTER INSERT ON goals BEGIN
+        INSERT INTO goal_status_stats (user_id, status, goal_count) VALUES (new.user_id, new.status, 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET goal_count = goal_count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS goals_stats_ad AFTER DELETE ON goals BEGIN
+        UPDATE goal_status_stats SET goal_count = goal_count - 1 WHERE user_id = old.user_id AND status = old.status;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS goals_stats_au AFTER UPDATE OF user_id, status ON goals BEGIN
+        UPDATE goal_status_stats SET goal_count = goal_count - 1 WHERE user_id = old.user_id AND status = old.status;
+        INSERT INTO goal_status_stats (user_id, status, goal_count) VALUES (new.user_id, new.status, 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET goal_count = goal_count + 1;
+    END;
+
+    INSERT OR REPLACE INTO daily_category_stats (user_id, day, main_category, sub_category, entry_count, confidence_sum)
+    SELECT user_id, date(created_at), main_category, COALESCE(sub_category, ''), COUNT(*),
+           SUM(CASE WHEN json_valid(confidence_scores)
+                    THEN COALESCE(json_extract(confidence_scores, '$."' || main_category || '"'), 0) ELSE 0 END)
+    FROM entries
+    GROUP BY user_id, date(created_at), main_category, COALESCE(sub_category, '');
 
-    CREATE TABLE IF NOT EXISTS tags (
-        tag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    INSERT OR REPLACE INTO goal_status_stats (user_id, status, goal_count)
+    SELECT user_id, status, COUNT(*) FROM goals GROUP BY user_id, status;
+    """,
+    # 7: float32 embedding vectors for entries and goals (see similarity.py)
+    """
+    CREATE TABLE IF NOT EXISTS embeddings (
+        kind TEXT NOT NULL,
+        item_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        dim INTEGER NOT NULL,
+        vector BLOB NOT NULL,
+        PRIMARY KEY (kind, item_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_embeddings_user_kind ON embeddings(user_id, kind);
+
+    CREATE TRIGGER IF NOT EXISTS entries_embedding_ad AFTER DELETE ON entries BEGIN
+        DELETE FROM embeddings WHERE kind = 'entry' AND item_id = old.entry_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS goals_embedding_ad AFTER DELETE ON goals BEGIN
+        DELETE FROM embeddings WHERE kind = 'goal' AND item_id = old.goal_id;
+    END;
+    """,
+    # 8: per-entry stage timings in ms (see metrics.py)
+    """
+    CREATE TABLE IF NOT EXISTS entry_metrics (
+        metric_id INTEGER PRIMARY KEY AUTOINCREMENT,
         entry_id INTEGER NOT NULL,
-        tag TEXT NOT NULL,
-        FOREIGN KEY (entry_id) REFERENCES entries(entry_id)
+        stage TEXT NOT NULL,
+        value REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+    CREATE INDEX IF NOT EXISTS idx_entry_metrics_entry ON entry_metrics(entry_id);
+    CREATE INDEX IF NOT EXISTS idx_entry_metrics_stage_created ON entry_metrics(stage, created_at);
 
-    CREATE TABLE IF NOT EXISTS goals (
-        goal_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        goal_text TEXT NOT NULL,
-        category TEXT,
-        sub_category TEXT,
-        status TEXT NOT NULL DEFAULT 'planned',
-        target_amount REAL,
-        current_amount REAL DEFAULT 0,
-        due_date TEXT,
-        notes TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    CREATE TRIGGER IF NOT EXISTS entries_metrics_ad AFTER DELETE ON entries BEGIN
+        DELETE FROM entry_metrics WHERE entry_id = old.entry_id;
+    END;
+    """,
+    # 9: raw entailment logits per entry chunk and the label config each entry was classified
+    # under, so label/threshold changes can be re-applied without the model (see diary_cli.py reclassify)
+    """
+    ALTER TABLE entries ADD COLUMN config_version TEXT;
+
+    CREATE TABLE IF NOT EXISTS hypotheses (
+        hypothesis_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scorer TEXT NOT NULL,
+        label TEXT NOT NULL,
+        UNIQUE (scorer, label)
     );
 
-    CREATE TABLE IF NOT EXISTS goal_links (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        goal_id INTEGER NOT NULL,
+    CREATE TABLE IF NOT EXISTS entry_logits (
         entry_id INTEGER NOT NULL,
-        link_type TEXT NOT NULL DEFAULT 'reference',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (goal_id) REFERENCES goals(goal_id),
-        FOREIGN KEY (entry_id) REFERENCES entries(entry_id)
-    );
-    """)
-    # Ensure default user exists
-    cur.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (1, "default_user"))
-    conn.commit()
-    conn.close()
+        chunk INTEGER NOT NULL,
+        hypothesis_id INTEGER NOT NULL,
+        logit REAL NOT NULL,
+        PRIMARY KEY (entry_id, chunk, hypothesis_id)
+    ) WITHOUT ROWID;
 
-# ------------------ Entry Functions ------------------
+    CREATE TRIGGER IF NOT EXISTS entries_logits_ad AFTER DELETE ON entries BEGIN
+        DELETE FROM entry_logits WHERE entry_id = old.entry_id;
+    END;
+    """,
+    # 10: compact storage (see _compact_storage)
+    _compact_storage,
+]
+
+# First schema without the JSON scores and the tags table; migrating an existing database
+# past it is followed by a VACUUM so the file actually shrinks
+COMPACT_STORAGE_VERSION = 10
+
+def _statements(script: str) -> List[str]:
+    """Split a script into complete statements (trigger bodies stay intact)."""
+    out, buf = [], ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            out.append(buf.strip())
+            buf = ""
+    if buf.strip():
+        out.append(buf.strip())
+    return out
+
+def schema_version(db_path: str = DB_PATH) -> int:
+    return get_conn(db_path).execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db_path: str = DB_PATH):
+    """Apply pending MIGRATIONS, each in its own transaction."""
+    # Only a database that already held entries in the old layout has space to give back
+    vacuum = schema_version(db_path) < COMPACT_STORAGE_VERSION and _has_legacy_entries(db_path)
+    while schema_version(db_path) < len(MIGRATIONS):
+        with transaction(db_path) as t:
+            # Re-read under the write lock in case another process migrated first
+            version = t.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                break
+            step = MIGRATIONS[version]
+            if callable(step):
+                step(t)
+            else:
+                for stmt in _statements(step):
+                    t.execute(stmt)
+            t.execute(f"PRAGMA user_version = {version + 1}")
+    if vacuum and schema_version(db_path) >= COMPACT_STORAGE_VERSION:
+        get_conn(db_path).execute("VACUUM")
 
-def save_entry(result: ClassificationResult, db_path: str = DB_PATH) -> int:
+def _has_legacy_entries(db_path: str) -> bool:
+    """Whether entries still has the pre-compaction confidence_scores column and any rows."""
     conn = get_conn(db_path)
-    cur = conn.cursor()
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+    return "confidence_scores" in columns and conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone() is not None
+
+# Tag names of entry e, in order, as one comma-separated string
+_TAGS_SQL = """(SELECT GROUP_CONCAT(l.label) FROM entry_tags t JOIN labels l ON l.label_id = t.label_id
+     WHERE t.entry_id = e.entry_id)"""
+
+# Queries on the request path; each must be answered from an index, not a table scan
+HOT_QUERIES = {
+    "entries_by_user": ("SELECT e.entry_id FROM entries e WHERE e.user_id = ? ORDER BY e.created_at DESC",
+                        (DEFAULT_USER_ID,)),
+    "tags_by_entry": (f"SELECT e.entry_id, {_TAGS_SQL} FROM entries e WHERE e.entry_id = ?", (1,)),
+    "entries_by_tag": ("""
+        SELECT t.entry_id FROM entry_tags t WHERE t.label_id = (SELECT label_id FROM labels WHERE label = ?)
+    """, ("Goals",)),
+    "goals_by_user": ("SELECT goal_id FROM goals WHERE user_id = ? ORDER BY created_at DESC", (DEFAULT_USER_ID,)),
+    "goals_by_status": ("SELECT goal_id FROM goals WHERE user_id = ? AND status = ? ORDER BY created_at DESC",
+                        (DEFAULT_USER_ID, "planned")),
+    "entries_page_by_category": ("""
+        SELECT e.entry_id FROM entries e
+        WHERE e.user_id = ? AND e.main_category = ? AND (e.created_at, e.entry_id) < (?, ?)
+        ORDER BY e.created_at DESC, e.entry_id DESC LIMIT 21
+    """, (DEFAULT_USER_ID, "Goals", "9999", 0)),
+    "goals_page": ("""
+        SELECT goal_id FROM goals WHERE user_id = ? AND (created_at, goal_id) < (?, ?)
+        ORDER BY created_at DESC, goal_id DESC LIMIT 21
+    """, (DEFAULT_USER_ID, "9999", 0)),
+    "pending_jobs": ("SELECT job_id FROM ingest_jobs WHERE status = 'pending' ORDER BY job_id LIMIT 16", ()),
+    "links_by_goal": ("SELECT entry_id FROM goal_links WHERE goal_id = ?", (1,)),
+    "links_by_entry": ("SELECT goal_id FROM goal_links WHERE entry_id = ?", (1,)),
+    "metrics_by_entry": ("SELECT stage, value FROM entry_metrics WHERE entry_id = ?", (1,)),
+    "user_by_name": ("SELECT user_id FROM users WHERE username = ?", ("default_user",)),
+    "logits_by_entry": ("SELECT chunk, hypothesis_id, logit FROM entry_logits WHERE entry_id = ?", (1,)),
+}
+
+def explain_hot_queries(db_path: str = DB_PATH) -> Dict[str, List[str]]:
+    conn = get_conn(db_path)
+    return {name: [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            for name, (sql, params) in HOT_QUERIES.items()}
+
+# Request-path reads; trace_hot_paths runs them to capture the SQL they actually issue
+def _hot_path_calls(db_path: str) -> Dict[str, Callable[[], object]]:
+    calls = {
+        "get_entries_page": lambda: get_entries_page(db_path=db_path),
+        "get_entries_page_filtered": lambda: get_entries_page(
+            cursor=("9999-12-31", 1 << 62), category="Goals", tag="Goals", start_date="2000-01-01",
+            end_date="9999-12-31", db_path=db_path),
+        "get_entries_by_ids": lambda: get_entries_by_ids([1, 2], db_path=db_path),
+        "iter_entries": lambda: list(iter_entries(db_path)),
+        "get_goals_page": lambda: get_goals_page(cursor=("9999-12-31", 1 << 62), status="planned", db_path=db_path),
+        "find_existing_goals_like": lambda: find_existing_goals_like("save money for a car", db_path=db_path,
+                                                                     exclude_status="completed"),
+        "get_category_trends": lambda: get_category_trends("2000-01-01", "9999-12-31", by_sub=True, db_path=db_path),
+        "get_goal_status_counts": lambda: get_goal_status_counts(db_path=db_path),
+        "get_entry_metrics": lambda: get_entry_metrics(1, db_path=db_path),
+    }
+    try:
+        import pandas  # noqa: F401
+        calls["get_entries_df"] = lambda: get_entries_df(db_path=db_path)
+        calls["get_goals_df"] = lambda: get_goals_df(db_path=db_path)
+    except ImportError:
+        pass
+    return calls
+
+def trace_hot_paths(db_path: str = DB_PATH) -> Dict[str, List[str]]:
+    """The SELECTs each request-path read issues, with parameters inlined."""
+    conn = get_conn(db_path)
+    traced = {}
+    for name, call in _hot_path_calls(db_path).items():
+        seen: List[str] = []
+        conn.set_trace_callback(seen.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        # FTS5 reads its own shadow tables (goals_fts_config, ...) through the same connection
+        traced[name] = [sql for sql in dict.fromkeys(seen)
+                        if sql.lstrip().upper().startswith(("SELECT", "WITH")) and "_fts_" not in sql]
+    return traced
+
+def find_full_scans(db_path: str = DB_PATH) -> Dict[str, List[str]]:
+    """Hot queries and request-path reads whose plan contains a full table scan (empty dict means all good)."""
+    plans = explain_hot_queries(db_path)
+    conn = get_conn(db_path)
+    for name, statements in trace_hot_paths(db_path).items():
+        for i, sql in enumerate(statements):
+            plans[f"{name}[{i}]"] = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    bad = {}
+    for name, plan in plans.items():
+        scans = [step for step in plan if step.startswith("SCAN ") and "INDEX" not in step]
+        if scans:
+            bad[name] = scans
+    return bad
+
+# ------------------ Entry Functions ------------------
+
+def save_entry(result: ClassificationResult, db_path: str = DB_PATH, tx: Optional[Transaction] = None,
+               user_id: int = DEFAULT_USER_ID) -> int:
+    with tx or transaction(db_path) as t, span("db_write"):
+        entry_id = _insert_entry(t.cursor(), result, user_id)
+    return entry_id
+
+def _insert_entry(cur: sqlite3.Cursor, result: ClassificationResult, user_id: int) -> int:
+    ids = _result_label_ids(cur, [result])
     cur.execute("""
     INSERT INTO entries (
         user_id, entry_text, main_category, secondary_category, sub_category,
-        confidence_scores, processing_time, success, error_message
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        scores, main_confidence, processing_time, success, error_message, config_version
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (
-        1,
+        user_id,
         result.entry,
         result.main_category,
         result.secondary_category,
         result.sub_category,
-        dumps(result.confidence_scores or {}),
+        _pack_scores(result.confidence_scores, ids),
+        _main_confidence(result.main_category, result.confidence_scores),
         result.processing_time,
         int(result.success),
-        result.error_message
+        result.error_message,
+        result.config_version
     ))
     entry_id = cur.lastrowid
-
-    # Insert tags
-    tags = [result.main_category]
-    if result.secondary_category:
-        tags.append(result.secondary_category)
-    if result.sub_category:
-        tags.append(result.sub_category)
-    for tag in tags:
-        cur.execute("INSERT INTO tags (entry_id, tag) VALUES (?, ?)", (entry_id, tag))
-
-    conn.commit()
-    conn.close()
+    _insert_tags(cur, [(entry_id, result)], ids)
+    _insert_logits(cur, [(entry_id, result)])
     return entry_id
 
-def delete_entry(entry_id: int, db_path: str = DB_PATH):
+def _main_confidence(main_category: str, confidence_scores: Optional[Dict[str, float]]) -> float:
+    return float((confidence_scores or {}).get(main_category, 0.0))
+
+def _label_ids(cur: sqlite3.Cursor, labels) -> Dict[str, int]:
+    """label_id of every label, interning new ones."""
+    labels = list(set(labels))
+    if not labels:
+        return {}
+    query = f"SELECT label, label_id FROM labels WHERE label IN ({','.join('?' * len(labels))})"
+    ids = dict(cur.execute(query, labels).fetchall())
+    if len(ids) < len(labels):
+        cur.executemany("INSERT OR IGNORE INTO labels (label) VALUES (?)", [(label,) for label in labels if label not in ids])
+        ids = dict(cur.execute(query, labels).fetchall())
+    return ids
+
+def _label_names(conn: sqlite3.Connection, label_ids) -> Dict[int, str]:
+    label_ids = list(set(label_ids))
+    if not label_ids:
+        return {}
+    return dict(conn.execute(f"SELECT label_id, label FROM labels WHERE label_id IN ({','.join('?' * len(label_ids))})",
+                             label_ids).fetchall())
+
+def _result_label_ids(cur: sqlite3.Cursor, results: List[ClassificationResult]) -> Dict[str, int]:
+    return _label_ids(cur, [label for r in results for label in _entry_tags(r) + list(r.confidence_scores or {})])
+
+# entries.scores packs (label_id int32, score float32) pairs, best score first
+_SCORE_PAIR = struct.Struct("<if")
+
+def _pack_scores(confidence_scores: Optional[Dict[str, float]], ids: Dict[str, int]) -> Optional[bytes]:
+    if not confidence_scores:
+        return None
+    ranked = sorted(confidence_scores.items(), key=lambda kv: kv[1], reverse=True)
+    return b"".join(_SCORE_PAIR.pack(ids[label], score) for label, score in ranked)
+
+def _unpack_scores(blob: Optional[bytes], names: Dict[int, str]) -> Dict[str, float]:
+    # float32 keeps ~7 significant digits; rounding restores the stored 3-decimal scores exactly
+    return {names[label_id]: round(score, 6) for label_id, score in _SCORE_PAIR.iter_unpack(blob or b"")}
+
+def _insert_tags(cur: sqlite3.Cursor, items: List[Tuple[int, ClassificationResult]], ids: Dict[str, int]):
+    cur.executemany("INSERT INTO entry_tags (entry_id, position, label_id) VALUES (?, ?, ?)", [
+        (entry_id, position, ids[tag]) for entry_id, r in items for position, tag in enumerate(_entry_tags(r))
+    ])
+
+def _insert_logits(cur: sqlite3.Cursor, items: List[Tuple[int, ClassificationResult]]):
+    """Store each result's per-chunk logits, interning labels in the hypotheses table."""
+    by_scorer: Dict[str, List[Tuple[int, ClassificationResult]]] = {}
+    for entry_id, r in items:
+        if r.logits and r.scorer:
+            by_scorer.setdefault(r.scorer, []).append((entry_id, r))
+    for scorer, group in by_scorer.items():
+        labels = {label for _, r in group for chunk in r.logits for label in chunk}
+        cur.executemany("INSERT OR IGNORE INTO hypotheses (scorer, label) VALUES (?, ?)",
+                        [(scorer, label) for label in labels])
+        ids = dict(cur.execute("SELECT label, hypothesis_id FROM hypotheses WHERE scorer = ?", (scorer,)).fetchall())
+        cur.executemany("INSERT OR REPLACE INTO entry_logits (entry_id, chunk, hypothesis_id, logit) VALUES (?, ?, ?, ?)", [
+            (entry_id, chunk, ids[label], logit)
+            for entry_id, r in group for chunk, logits in enumerate(r.logits) for label, logit in logits.items()
+        ])
+
+def _entry_tags(result: ClassificationResult) -> List[str]:
+    """Entry categories plus those of its chunks (for long entries), without duplicates."""
+    tags = [result.main_category, result.secondary_category, result.sub_category]
+    for chunk in result.chunks:
+        tags.extend((chunk["main_category"], chunk["sub_category"]))
+    return list(dict.fromkeys(tag for tag in tags if tag))
+
+def save_entries(results: List[ClassificationResult], created_at: Optional[List[Optional[str]]] = None,
+                 db_path: str = DB_PATH, tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID) -> List[int]:
+    """Bulk version of save_entry using executemany; returns the new entry ids in order.
+
+    Ids are allocated up front under the write lock so tags can be inserted in
+    the same executemany batch. ``created_at`` optionally preserves original
+    timestamps (None items fall back to now).
+    """
+    if not results:
+        return []
+    created_at = created_at or [None] * len(results)
+    with tx or transaction(db_path) as t, span("db_write"):
+        cur = t.cursor()
+        cur.execute("""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'entries'), 0),
+                   COALESCE((SELECT MAX(entry_id) FROM entries), 0))
+        """)
+        first = cur.fetchone()[0] + 1
+        ids = list(range(first, first + len(results)))
+        label_ids = _result_label_ids(cur, results)
+        cur.executemany("""
+        INSERT INTO entries (
+            entry_id, user_id, entry_text, main_category, secondary_category, sub_category,
+            scores, main_confidence, processing_time, success, error_message, config_version, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        """, [
+            (entry_id, user_id, r.entry, r.main_category, r.secondary_category, r.sub_category,
+             _pack_scores(r.confidence_scores, label_ids), _main_confidence(r.main_category, r.confidence_scores),
+             r.processing_time, int(r.success), r.error_message, r.config_version, ts)
+            for entry_id, r, ts in zip(ids, results, created_at)
+        ])
+        _insert_tags(cur, list(zip(ids, results)), label_ids)
+        _insert_logits(cur, list(zip(ids, results)))
+    return ids
+
+def iter_entries(db_path: str = DB_PATH, chunk_size: int = 1000, user_id: int = DEFAULT_USER_ID):
+    """Stream entries (as dicts, oldest first) without materializing the table."""
     conn = get_conn(db_path)
     cur = conn.cursor()
-    cur.execute("DELETE FROM tags WHERE entry_id = ?", (entry_id,))
-    cur.execute("DELETE FROM entries WHERE entry_id = ?", (entry_id,))
-    conn.commit()
-    conn.close()
+    cur.execute(f"""
+    SELECT e.entry_id, e.entry_text, e.main_category, e.secondary_category, e.sub_category,
+           e.scores AS confidence_scores, e.processing_time, e.success, e.error_message,
+           e.created_at, {_TAGS_SQL} AS tags
+    FROM entries e
+    WHERE e.user_id = ?
+    ORDER BY e.created_at, e.entry_id
+    """, (user_id,))
+    cols = [d[0] for d in cur.description]
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from _decode_entries(conn, [dict(zip(cols, r)) for r in rows])
+
+def _decode_entries(conn: sqlite3.Connection, rows: List[Dict]) -> List[Dict]:
+    """Split tags and unpack confidence_scores of rows in place, looking up their labels at once."""
+    names = _label_names(conn, (label_id for row in rows
+                                for label_id, _ in _SCORE_PAIR.iter_unpack(row["confidence_scores"] or b"")))
+    for row in rows:
+        row["tags"] = row["tags"].split(",") if row["tags"] else []
+        row["confidence_scores"] = _unpack_scores(row["confidence_scores"], names)
+    return rows
+
+def get_import_checkpoint(source: str, db_path: str = DB_PATH) -> int:
+    row = get_conn(db_path).execute("SELECT records FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else 0
+
+def set_import_checkpoint(source: str, records: int, db_path: str = DB_PATH, tx: Optional[Transaction] = None):
+    with tx or transaction(db_path) as t:
+        t.execute("""
+        INSERT INTO import_checkpoints (source, records) VALUES (?, ?)
+        ON CONFLICT(source) DO UPDATE SET records = excluded.records, updated_at = CURRENT_TIMESTAMP
+        """, (source, records))
+
+def delete_entry(entry_id: int, db_path: str = DB_PATH, tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
+    with tx or transaction(db_path) as t:
+        cur = t.cursor()
+        # Tags, logits, metrics and embeddings go with it (entries_*_ad triggers)
+        cur.execute("DELETE FROM entries WHERE entry_id = ? AND user_id = ?", (entry_id, user_id))
 
 def update_entry(entry_id: int, entry_text: str, main_category: str, secondary_category: Optional[str],
-                 sub_category: Optional[str], confidence_scores: Dict, db_path: str = DB_PATH):
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute("""
-    UPDATE entries
-    SET entry_text = ?, main_category = ?, secondary_category = ?, sub_category = ?, confidence_scores = ?
-    WHERE entry_id = ?
-    """, (entry_text, main_category, secondary_category, sub_category, dumps(confidence_scores), entry_id))
-    conn.commit()
-    conn.close()
-
-def get_entries_df(db_path: str = DB_PATH):
+                 sub_category: Optional[str], confidence_scores: Dict, db_path: str = DB_PATH,
+                 tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
+    """Edit an entry; its tags follow the new categories.
+
+    A changed text also drops the entry's logits and embedding and clears its
+    config_version, so reclassify and the embedding backfill redo it from scratch.
+    """
+    result = ClassificationResult(entry=entry_text, main_category=main_category, secondary_category=secondary_category,
+                                  sub_category=sub_category, confidence_scores=confidence_scores or {})
+    with tx or transaction(db_path) as t:
+        cur = t.cursor()
+        row = cur.execute("SELECT entry_text FROM entries WHERE entry_id = ? AND user_id = ?",
+                          (entry_id, user_id)).fetchone()
+        if row is None:
+            return
+        text_changed = row[0] != entry_text
+        ids = _result_label_ids(cur, [result])
+        cur.execute("""
+        UPDATE entries
+        SET entry_text = ?, main_category = ?, secondary_category = ?, sub_category = ?, scores = ?, main_confidence = ?,
+            config_version = CASE WHEN ? THEN NULL ELSE config_version END
+        WHERE entry_id = ? AND user_id = ?
+        """, (entry_text, main_category, secondary_category, sub_category,
+              _pack_scores(confidence_scores, ids), _main_confidence(main_category, confidence_scores),
+              text_changed, entry_id, user_id))
+        cur.execute("DELETE FROM entry_tags WHERE entry_id = ?", (entry_id,))
+        _insert_tags(cur, [(entry_id, result)], ids)
+        if text_changed:
+            cur.execute("DELETE FROM entry_logits WHERE entry_id = ?", (entry_id,))
+            cur.execute("DELETE FROM embeddings WHERE kind = 'entry' AND item_id = ?", (entry_id,))
+
+def get_stale_entries(config_version: str, after_id: int = 0, limit: int = 64, db_path: str = DB_PATH,
+                      user_id: int = DEFAULT_USER_ID) -> List[Tuple[int, str]]:
+    """(entry_id, entry_text) of entries classified under another config_version, in id order after after_id."""
+    return get_conn(db_path).execute("""
+    SELECT entry_id, entry_text FROM entries
+    WHERE user_id = ? AND entry_id > ? AND config_version IS NOT ?
+    ORDER BY entry_id LIMIT ?
+    """, (user_id, after_id, config_version, limit)).fetchall()
+
+def count_stale_entries(config_version: str, db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> int:
+    return get_conn(db_path).execute("SELECT COUNT(*) FROM entries WHERE user_id = ? AND config_version IS NOT ?",
+                                     (user_id, config_version)).fetchone()[0]
+
+def get_entry_logits(entry_ids: List[int], scorer: str, db_path: str = DB_PATH,
+                     tx: Optional[Transaction] = None) -> Dict[int, List[Dict[str, float]]]:
+    """Stored per-chunk logits (label -> logit) of the given entries under one scorer."""
+    if not entry_ids:
+        return {}
+    rows = _reader(db_path, tx).execute(f"""
+    SELECT l.entry_id, l.chunk, h.label, l.logit
+    FROM entry_logits l JOIN hypotheses h ON h.hypothesis_id = l.hypothesis_id
+    WHERE l.entry_id IN ({",".join("?" * len(entry_ids))}) AND h.scorer = ?
+    """, (*entry_ids, scorer)).fetchall()
+    out: Dict[int, List[Dict[str, float]]] = {}
+    for entry_id, chunk, label, logit in rows:
+        chunks = out.setdefault(entry_id, [])
+        while len(chunks) <= chunk:
+            chunks.append({})
+        chunks[chunk][label] = logit
+    return out
+
+def apply_reclassification(entry_id: int, result: ClassificationResult, db_path: str = DB_PATH,
+                           tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
+    """Overwrite an entry's categories, tags and logits with a fresh result for the same text."""
+    with tx or transaction(db_path) as t, span("db_write"):
+        cur = t.cursor()
+        ids = _result_label_ids(cur, [result])
+        cur.execute("""
+        UPDATE entries
+        SET main_category = ?, secondary_category = ?, sub_category = ?, scores = ?, main_confidence = ?,
+            config_version = ?
+        WHERE entry_id = ? AND user_id = ?
+        """, (result.main_category, result.secondary_category, result.sub_category,
+              _pack_scores(result.confidence_scores, ids), _main_confidence(result.main_category, result.confidence_scores),
+              result.config_version, entry_id, user_id))
+        if not cur.rowcount:
+            return
+        cur.execute("DELETE FROM entry_tags WHERE entry_id = ?", (entry_id,))
+        _insert_tags(cur, [(entry_id, result)], ids)
+        if result.logits:
+            # The result carries every logit still valid for its scorer; anything else is stale
+            cur.execute("DELETE FROM entry_logits WHERE entry_id = ?", (entry_id,))
+            _insert_logits(cur, [(entry_id, result)])
+
+def get_entries_df(db_path: str = DB_PATH, tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
+    """A user's entries, newest first, decoded column-wise rather than row by row.
+
+    ``tags`` holds a list of tag names per entry. Confidence scores become
+    float32 columns ``score_<label>``, one per label any entry was scored on
+    (NaN where an entry has no score for it); all packed score blobs are
+    decoded with a single ``np.frombuffer``.
+    """
+    import numpy as np
     import pandas as pd
-    conn = get_conn(db_path)
-    df = pd.read_sql_query("""
+    conn = _reader(db_path, tx)
+    df = pd.read_sql_query(f"""
     SELECT e.entry_id, e.entry_text, e.main_category, e.secondary_category, e.sub_category,
-           e.confidence_scores, e.processing_time, e.success, e.error_message,
-           e.created_at, GROUP_CONCAT(t.tag) AS tags
+           e.main_confidence, e.processing_time, e.success, e.error_message,
+           e.created_at, {_TAGS_SQL} AS tags, e.scores, COALESCE(length(e.scores), 0) AS scores_len
     FROM entries e
-    LEFT JOIN tags t ON e.entry_id = t.entry_id
-    GROUP BY e.entry_id
+    WHERE e.user_id = ?
     ORDER BY e.created_at DESC
-    """, conn)
-    conn.close()
-    if not df.empty:
-        df["tags"] = df["tags"].apply(lambda x: x.split(",") if isinstance(x, str) else [])
-        df["confidence_scores"] = df["confidence_scores"].apply(lambda x: loads(x) if x else {})
-    return df
+    """, conn, params=(user_id,))
+    if df.empty:
+        return df.drop(columns=["scores", "scores_len"])
+    tags = df["tags"].str.split(",")
+    untagged = tags.isna()
+    if untagged.any():
+        tags[untagged] = pd.Series([[] for _ in range(int(untagged.sum()))], index=tags.index[untagged])
+    df["tags"] = tags
+
+    pairs = np.frombuffer(b"".join(df.pop("scores").dropna()), dtype=[("label_id", "<i4"), ("score", "<f4")])
+    rows = np.repeat(np.arange(len(df)), df.pop("scores_len").astype("int64").to_numpy() // _SCORE_PAIR.size)
+    label_ids = np.unique(pairs["label_id"])
+    wide = np.full((len(df), len(label_ids)), np.nan, dtype=np.float32)
+    wide[rows, np.searchsorted(label_ids, pairs["label_id"])] = pairs["score"]
+    names = _label_names(conn, label_ids.tolist())
+    scores = pd.DataFrame(wide, columns=[f"score_{names[i]}" for i in label_ids.tolist()], index=df.index)
+    return pd.concat([df, scores], axis=1)
+
+def get_entries_page(cursor: Optional[Tuple[str, int]] = None, limit: int = 20, category: Optional[str] = None,
+                     tag: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                     db_path: str = DB_PATH, tx: Optional[Transaction] = None,
+                     user_id: int = DEFAULT_USER_ID) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+    """One page of entries, newest first, with filters evaluated in SQL.
+
+    ``cursor`` is the (created_at, entry_id) returned with the previous page;
+    the returned cursor is None on the last page. Dates are inclusive
+    ``YYYY-MM-DD`` strings.
+    """
+    where, params = ["e.user_id = ?"], [user_id]
+    if category:
+        where.append("e.main_category = ?")
+        params.append(category)
+    if tag:
+        where.append("""EXISTS (SELECT 1 FROM entry_tags t WHERE t.entry_id = e.entry_id
+                        AND t.label_id = (SELECT label_id FROM labels WHERE label = ?))""")
+        params.append(tag)
+    if start_date:
+        where.append("e.created_at >= ?")
+        params.append(start_date)
+    if end_date:
+        where.append("e.created_at < date(?, '+1 day')")
+        params.append(end_date)
+    if cursor:
+        where.append("(e.created_at, e.entry_id) < (?, ?)")
+        params.extend(cursor)
+    with span("sql_query"):
+        cur = _reader(db_path, tx).cursor()
+        cur.execute(f"""
+        SELECT e.entry_id, e.entry_text, e.main_category, e.secondary_category, e.sub_category,
+               e.scores AS confidence_scores, e.processing_time, e.success, e.error_message,
+               e.created_at, {_TAGS_SQL} AS tags
+        FROM entries e
+        WHERE {" AND ".join(where)}
+        ORDER BY e.created_at DESC, e.entry_id DESC
+        LIMIT ?
+        """, (*params, limit + 1))
+        cols = [d[0] for d in cur.description]
+        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]["created_at"], rows[-1]["entry_id"])
+    # Only the rows on this page are decoded
+    return _decode_entries(cur.connection, rows), next_cursor
 
 # ------------------ Goals Functions ------------------
 
 def add_goal(goal_text: str, category: Optional[str] = None, sub_category: Optional[str] = None,
              target_amount: Optional[float] = None, due_date: Optional[str] = None,
-             notes: Optional[str] = None, status: str = "planned", db_path: str = DB_PATH) -> int:
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute("""
-    INSERT INTO goals (user_id, goal_text, category, sub_category, status, target_amount, due_date, notes)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (1, goal_text, category, sub_category, status, target_amount, due_date, notes))
-    goal_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+             notes: Optional[str] = None, status: str = "planned", db_path: str = DB_PATH,
+             tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID) -> int:
+    with tx or transaction(db_path) as t:
+        cur = t.cursor()
+        cur.execute("""
+        INSERT INTO goals (user_id, goal_text, category, sub_category, status, target_amount, due_date, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, goal_text, category, sub_category, status, target_amount, due_date, notes))
+        goal_id = cur.lastrowid
     return goal_id
 
-def update_goal(goal_id: int, goal_text: str, status: str, db_path: str = DB_PATH):
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute("""
-    UPDATE goals
-    SET goal_text = ?, status = ?, updated_at = CURRENT_TIMESTAMP
-    WHERE goal_id = ?
-    """, (goal_text, status, goal_id))
-    conn.commit()
-    conn.close()
-
-def get_goals_df(db_path: str = DB_PATH):
+def update_goal(goal_id: int, goal_text: str, status: str, db_path: str = DB_PATH, tx: Optional[Transaction] = None,
+                user_id: int = DEFAULT_USER_ID):
+    with tx or transaction(db_path) as t:
+        t.execute("""
+        UPDATE goals
+        SET goal_text = ?, status = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE goal_id = ? AND user_id = ?
+        """, (goal_text, status, goal_id, user_id))
+
+def get_goals_df(db_path: str = DB_PATH, tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
     import pandas as pd
-    conn = get_conn(db_path)
+    conn = _reader(db_path, tx)
     df = pd.read_sql_query("""
     SELECT goal_id, goal_text, category, sub_category, status, target_amount, current_amount, due_date,
            created_at, updated_at
     FROM goals
+    WHERE user_id = ?
     ORDER BY created_at DESC
-    """, conn)
-    conn.close()
+    """, conn, params=(user_id,))
     return df
 
+def get_goals_page(cursor: Optional[Tuple[str, int]] = None, limit: int = 20, status: Optional[str] = None,
+                   db_path: str = DB_PATH, tx: Optional[Transaction] = None,
+                   user_id: int = DEFAULT_USER_ID) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+    """One page of goals, newest first; see get_entries_page for the cursor contract."""
+    where, params = ["user_id = ?"], [user_id]
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if cursor:
+        where.append("(created_at, goal_id) < (?, ?)")
+        params.extend(cursor)
+    cur = _reader(db_path, tx).cursor()
+    cur.execute(f"""
+    SELECT goal_id, goal_text, category, sub_category, status, target_amount, current_amount, due_date,
+           created_at, updated_at
+    FROM goals
+    WHERE {" AND ".join(where)}
+    ORDER BY created_at DESC, goal_id DESC
+    LIMIT ?
+    """, (*params, limit + 1))
+    cols = [d[0] for d in cur.description]
+    rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]["created_at"], rows[-1]["goal_id"])
+    return rows, next_cursor
+
 # ------------------ Auto-process ------------------
 
 def auto_process_entry_for_goals(entry_id: int, entry_text: str, main_category: str,
-                                 sub_category: Optional[str], db_path: str = DB_PATH):
-    goals = extract_goals_from_text(entry_text, main_category, sub_category)
-    for g in goals:
-        existing = find_existing_goals_like(entry_text, db_path=db_path)
-        if existing:
-            link_goal_to_entry(existing[0][0], entry_id, link_type="progress", db_path=db_path)
-        else:
-            new_id = add_goal(goal_text=g["goal_text"], category=g.get("category"), sub_category=g.get("sub_category"),
-                              target_amount=g.get("target_amount"), due_date=g.get("due_date"), notes=g.get("notes"),
-                              status=g.get("status", "planned"), db_path=db_path)
-            link_goal_to_entry(new_id, entry_id, link_type="created", db_path=db_path)
-
-    completions = detect_goal_completion_mentions(entry_text)
-    for phrase in completions:
-        candidates = find_existing_goals_like(entry_text, db_path=db_path)
-        for (goal_id, _txt) in candidates[:1]:
-            update_goal(goal_id, _txt, "completed", db_path=db_path)
-            link_goal_to_entry(goal_id, entry_id, link_type="completed", db_path=db_path)
-
-def find_existing_goals_like(text: str, db_path: str = DB_PATH, limit: int = 5):
-    terms = [t for t in text.lower().split() if len(t) > 3]
+                                 sub_category: Optional[str], db_path: str = DB_PATH,
+                                 tx: Optional[Transaction] = None, embedding=None,
+                                 chunks: Optional[List[Dict]] = None, user_id: int = DEFAULT_USER_ID):
+    """Create, link or complete goals mentioned in an entry.
+
+    Goals are matched by full-text search; when that finds nothing and the
+    entry's ``embedding`` (a unit float32 vector) is given, by cosine similarity.
+    With ``chunks`` (ClassificationResult.chunks of a long entry) each chunk is
+    processed on its own text and categories, so one entry can yield several goals.
+    """
+    def match_goals(text, vector, exclude_status=None):
+        # Shared keywords are the stronger evidence; embeddings only catch paraphrases
+        found = find_existing_goals_like(text, db_path=db_path, tx=t, exclude_status=exclude_status, user_id=user_id)
+        if found or vector is None:
+            return found
+        from similarity import find_similar_goals
+        return find_similar_goals(vector, db_path=db_path, exclude_status=exclude_status, user_id=user_id)
+
+    def process(text, main, sub, vector):
+        goals = extract_goals_from_text(text, main, sub)
+        for g in goals:
+            existing = match_goals(text, vector)
+            if existing:
+                link_goal_to_entry(existing[0][0], entry_id, link_type="progress", db_path=db_path, tx=t, user_id=user_id)
+            else:
+                new_id = add_goal(goal_text=g["goal_text"], category=g.get("category"), sub_category=g.get("sub_category"),
+                                  target_amount=g.get("target_amount"), due_date=g.get("due_date"), notes=g.get("notes"),
+                                  status=g.get("status", "planned"), db_path=db_path, tx=t, user_id=user_id)
+                link_goal_to_entry(new_id, entry_id, link_type="created", db_path=db_path, tx=t, user_id=user_id)
+                if vector is not None and g["goal_text"] == text.strip():
+                    from similarity import to_blob
+                    save_embeddings("goal", [(new_id, to_blob(vector))], len(vector), db_path=db_path, tx=t,
+                                    user_id=user_id)
+
+        completions = detect_goal_completion_mentions(text)
+        for phrase in completions:
+            candidates = match_goals(text, vector, exclude_status="completed")
+            for (goal_id, _txt) in candidates[:1]:
+                update_goal(goal_id, _txt, "completed", db_path=db_path, tx=t, user_id=user_id)
+                link_goal_to_entry(goal_id, entry_id, link_type="completed", db_path=db_path, tx=t, user_id=user_id)
+
+    with tx or transaction(db_path) as t, span("goal_processing"):
+        if not chunks:
+            process(entry_text, main_category, sub_category, embedding)
+        # The entry embedding describes the whole text, so chunks are matched by full-text search
+        for chunk in chunks or []:
+            process(entry_text[chunk["start"]:chunk["end"]], chunk["main_category"], chunk["sub_category"], None)
+
+# Words too common in diary entries to say anything about which goal is meant
+GOAL_STOP_WORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being but by can could did do does
+doing done for from get got had has have having he her here him his how i i'm im if in into is it its it's just
+like me more most my myself no not now of off on once only or other our out over own really same she so some
+still such than that the their them then there these they this those through to today too tomorrow under until
+up very was we were what when where which while who why will with would yesterday you your
+want wanted goal goals plan plans planning going gonna finally finished completed achieved reached hit nailed
+""".split())
+
+def _goal_match_terms(text: str, max_terms: int = 12) -> List[str]:
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(word) > 2 and word not in GOAL_STOP_WORDS and word not in terms:
+            terms.append(word)
+    return terms[:max_terms]
+
+def find_existing_goals_like(text: str, db_path: str = DB_PATH, limit: int = 5, tx: Optional[Transaction] = None,
+                             exclude_status: Optional[str] = None, user_id: int = DEFAULT_USER_ID):
+    """The user's goals most relevant to text, best BM25 match first."""
+    terms = _goal_match_terms(text)
     if not terms:
         return []
-    q = " OR ".join(["goal_text LIKE ?"] * min(len(terms), 5))
-    params = [f"%{t}%" for t in terms[:5]]
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute(f"SELECT goal_id, goal_text FROM goals WHERE {q} ORDER BY goal_id DESC LIMIT ?", (*params, limit))
-    rows = cur.fetchall()
-    conn.close()
+    match = " OR ".join(f'"{t}"' for t in terms)
+    sql = """
+    SELECT g.goal_id, g.goal_text
+    FROM goals_fts
+    JOIN goals g ON g.goal_id = goals_fts.rowid
+    WHERE goals_fts MATCH ? AND g.user_id = ?
+    """
+    params = [match, user_id]
+    if exclude_status is not None:
+        sql += " AND g.status != ?"
+        params.append(exclude_status)
+    sql += " ORDER BY bm25(goals_fts), g.goal_id DESC LIMIT ?"
+    with span("sql_query"):
+        cur = _reader(db_path, tx).cursor()
+        cur.execute(sql, (*params, limit))
+        return cur.fetchall()
+
+def link_goal_to_entry(goal_id: int, entry_id: int, link_type: str = "reference", db_path: str = DB_PATH,
+                       tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
+    """Link a goal and an entry; nothing is written unless both belong to user_id."""
+    with tx or transaction(db_path) as t:
+        t.execute("""
+        INSERT INTO goal_links (goal_id, entry_id, link_type)
+        SELECT g.goal_id, e.entry_id, ? FROM goals g JOIN entries e ON e.entry_id = ? AND e.user_id = g.user_id
+        WHERE g.goal_id = ? AND g.user_id = ?
+        """, (link_type, entry_id, goal_id, user_id))
+
+
+# ------------------ Analytics ------------------
+
+def get_category_trends(start_date: Optional[str] = None, end_date: Optional[str] = None, by_sub: bool = False,
+                        db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> List[Dict]:
+    """Daily entry counts and mean main-category confidence from the rollup table.
+
+    Cost depends on the number of days and categories in the range, not on the
+    number of entries. Dates are inclusive ``YYYY-MM-DD`` strings.
+    """
+    where, params = ["user_id = ?"], [user_id]
+    if start_date:
+        where.append("day >= ?")
+        params.append(start_date)
+    if end_date:
+        where.append("day <= ?")
+        params.append(end_date)
+    group = "day, main_category, sub_category" if by_sub else "day, main_category"
+    cur = get_conn(db_path).cursor()
+    cur.execute(f"""
+    SELECT {group}, SUM(entry_count) AS entry_count,
+           SUM(confidence_sum) / SUM(entry_count) AS mean_confidence
+    FROM daily_category_stats
+    WHERE {" AND ".join(where)}
+    GROUP BY {group}
+    ORDER BY day
+    """, params)
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+def get_goal_status_counts(db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> Dict[str, int]:
+    cur = get_conn(db_path).cursor()
+    cur.execute("SELECT status, goal_count FROM goal_status_stats WHERE user_id = ? AND goal_count > 0",
+                (user_id,))
+    return dict(cur.fetchall())
+
+# ------------------ Embeddings ------------------
+# kind is "entry" or "goal"; vectors are raw float32 bytes (see similarity.py)
+
+def save_embeddings(kind: str, items: List[Tuple[int, bytes]], dim: int, db_path: str = DB_PATH,
+                    tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
+    with tx or transaction(db_path) as t:
+        t.cursor().executemany(
+            "INSERT OR REPLACE INTO embeddings (kind, item_id, user_id, dim, vector) VALUES (?, ?, ?, ?, ?)",
+            [(kind, item_id, user_id, dim, blob) for item_id, blob in items],
+        )
+
+def load_embeddings(kind: str, db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID,
+                    after_id: int = 0) -> List[Tuple[int, bytes]]:
+    cur = get_conn(db_path).cursor()
+    cur.execute("SELECT item_id, vector FROM embeddings WHERE user_id = ? AND kind = ? AND item_id > ? ORDER BY item_id",
+                (user_id, kind, after_id))
+    return cur.fetchall()
+
+def embedding_ids(kind: str, db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> List[int]:
+    cur = get_conn(db_path).execute("SELECT item_id FROM embeddings WHERE user_id = ? AND kind = ? ORDER BY item_id",
+                                    (user_id, kind))
+    return [r[0] for r in cur.fetchall()]
+
+def get_unembedded(kind: str, after_id: int = 0, limit: int = 64, db_path: str = DB_PATH,
+                   user_id: int = DEFAULT_USER_ID) -> List[Tuple[int, str]]:
+    """(item_id, text) of entries or goals without a stored vector, in id order after after_id."""
+    table, key, text = {"entry": ("entries", "entry_id", "entry_text"), "goal": ("goals", "goal_id", "goal_text")}[kind]
+    cur = get_conn(db_path).execute(f"""
+    SELECT x.{key}, x.{text} FROM {table} x
+    WHERE x.user_id = ? AND x.{key} > ?
+      AND NOT EXISTS (SELECT 1 FROM embeddings v WHERE v.kind = ? AND v.item_id = x.{key})
+    ORDER BY x.{key}
+    LIMIT ?
+    """, (user_id, after_id, kind, limit))
+    return cur.fetchall()
+
+def get_embedding(kind: str, item_id: int, db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> Optional[bytes]:
+    row = get_conn(db_path).execute("SELECT vector FROM embeddings WHERE kind = ? AND item_id = ? AND user_id = ?",
+                                    (kind, item_id, user_id)).fetchone()
+    return row[0] if row else None
+
+def embeddings_version(kind: str, db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> Tuple[int, int]:
+    """(count, max item_id) of stored vectors; changes whenever rows are added or removed."""
+    return get_conn(db_path).execute(
+        "SELECT COUNT(*), COALESCE(MAX(item_id), 0) FROM embeddings WHERE user_id = ? AND kind = ?",
+        (user_id, kind)).fetchone()
+
+def get_entries_by_ids(entry_ids: List[int], db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> Dict[int, Dict]:
+    if not entry_ids:
+        return {}
+    cur = get_conn(db_path).cursor()
+    cur.execute(f"""
+    SELECT entry_id, entry_text, main_category, secondary_category, sub_category, created_at
+    FROM entries WHERE user_id = ? AND entry_id IN ({",".join("?" * len(entry_ids))})
+    """, [user_id, *entry_ids])
+    cols = [d[0] for d in cur.description]
+    return {r[0]: dict(zip(cols, r)) for r in cur.fetchall()}
+
+# ------------------ Stage Metrics ------------------
+
+def save_entry_metrics(entry_id: int, timings: Dict[str, float], db_path: str = DB_PATH,
+                       tx: Optional[Transaction] = None):
+    if not timings:
+        return
+    with tx or transaction(db_path) as t:
+        t.cursor().executemany("INSERT INTO entry_metrics (entry_id, stage, value) VALUES (?, ?, ?)",
+                               [(entry_id, stage, float(value)) for stage, value in timings.items()])
+
+def get_entry_metrics(entry_id: int, db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> Dict[str, float]:
+    cur = get_conn(db_path).cursor()
+    cur.execute("""
+    SELECT m.stage, m.value FROM entry_metrics m JOIN entries e ON e.entry_id = m.entry_id
+    WHERE m.entry_id = ? AND e.user_id = ? ORDER BY m.metric_id
+    """, (entry_id, user_id))
+    return dict(cur.fetchall())
+
+def get_stage_summary(since: Optional[str] = None, db_path: str = DB_PATH, user_id: Optional[int] = None) -> List[Dict]:
+    """Per-stage count, mean and max (ms) over stored entry metrics, slowest mean first.
+
+    Covers every user in db_path unless user_id is given.
+    """
+    where, params = [], []
+    if since:
+        where.append("m.created_at >= ?")
+        params.append(since)
+    if user_id is not None:
+        where.append("m.entry_id IN (SELECT entry_id FROM entries WHERE user_id = ?)")
+        params.append(user_id)
+    cur = get_conn(db_path).cursor()
+    cur.execute(f"""
+    SELECT m.stage, COUNT(*) AS count, AVG(m.value) AS mean_ms, MAX(m.value) AS max_ms
+    FROM entry_metrics m {"WHERE " + " AND ".join(where) if where else ""}
+    GROUP BY m.stage
+    ORDER BY mean_ms DESC
+    """, params)
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+# ------------------ Ingestion Jobs ------------------
+# Job status: pending -> processing -> done | failed (retried jobs go back to pending)
+
+def enqueue_entry(entry_text: str, db_path: str = DB_PATH, tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID) -> int:
+    with tx or transaction(db_path) as t:
+        cur = t.cursor()
+        cur.execute("INSERT INTO ingest_jobs (user_id, entry_text) VALUES (?, ?)", (user_id, entry_text))
+        job_id = cur.lastrowid
+    return job_id
+
+def claim_jobs(limit: int, db_path: str = DB_PATH) -> List[Tuple[int, int, str]]:
+    """Atomically move up to limit pending jobs (of any user) to processing; returns (job_id, user_id, entry_text)."""
+    with transaction(db_path) as t:
+        rows = t.execute(
+            "SELECT job_id, user_id, entry_text FROM ingest_jobs WHERE status = 'pending' ORDER BY job_id LIMIT ?",
+            (limit,)
+        ).fetchall()
+        t.cursor().executemany("""
+        UPDATE ingest_jobs SET status = 'processing', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = ?
+        """, [(row[0],) for row in rows])
     return rows
 
-def link_goal_to_entry(goal_id: int, entry_id: int, link_type: str = "reference", db_path: str = DB_PATH):
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute("INSERT INTO goal_links (goal_id, entry_id, link_type) VALUES (?, ?, ?)", (goal_id, entry_id, link_type))
-    conn.commit()
-    conn.close()
+def record_done_job(job_id: int, entry_text: str, entry_id: int, db_path: str = DB_PATH,
+                    tx: Optional[Transaction] = None, user_id: int = DEFAULT_USER_ID):
+    """Mark a queue job as done in a user's shard, in the transaction that saved its entry.
+
+    With sharding the queue lives in another file; this row lets a retried
+    job find its entry instead of saving it twice.
+    """
+    with tx or transaction(db_path) as t:
+        t.execute("""
+        INSERT OR REPLACE INTO ingest_jobs (job_id, user_id, entry_text, status, entry_id, attempts)
+        VALUES (?, ?, ?, 'done', ?, 1)
+        """, (job_id, user_id, entry_text, entry_id))
+
+def complete_job(job_id: int, entry_id: int, db_path: str = DB_PATH, tx: Optional[Transaction] = None):
+    with tx or transaction(db_path) as t:
+        t.execute("""
+        UPDATE ingest_jobs SET status = 'done', entry_id = ?, error_message = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = ?
+        """, (entry_id, job_id))
+
+def fail_job(job_id: int, error_message: str, max_attempts: int = 3, db_path: str = DB_PATH,
+             tx: Optional[Transaction] = None):
+    """Record a failure; the job is retried until it has been attempted max_attempts times."""
+    with tx or transaction(db_path) as t:
+        t.execute("""
+        UPDATE ingest_jobs
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+            error_message = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = ?
+        """, (max_attempts, error_message, job_id))
+
+def requeue_stale_jobs(older_than_s: int = 600, db_path: str = DB_PATH) -> int:
+    """Return jobs left in processing by a crashed worker to the queue."""
+    with transaction(db_path) as t:
+        cur = t.execute("""
+        UPDATE ingest_jobs SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'processing' AND updated_at < datetime('now', ?)
+        """, (f"-{int(older_than_s)} seconds",))
+        count = cur.rowcount
+    return count
+
+def get_jobs(job_ids: List[int], db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> List[Dict]:
+    if not job_ids:
+        return []
+    cur = get_conn(db_path).cursor()
+    cur.execute(f"""
+    SELECT job_id, status, entry_id, attempts, error_message, created_at, updated_at
+    FROM ingest_jobs WHERE user_id = ? AND job_id IN ({",".join("?" * len(job_ids))})
+    ORDER BY job_id DESC
+    """, [user_id, *job_ids])
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
@@ -0,0 +1,296 @@
+# diary_cli.py
+"""Bulk import/export of diary entries.
+
+    python diary_cli.py import archive.jsonl --chunk-size 64
+    python diary_cli.py import notes.txt --goals
+    python diary_cli.py export --format csv -o entries.csv
+    python diary_cli.py --user thandi --shard-dir shards import archive.jsonl
+    python diary_cli.py reclassify --batch-size 128
+    python diary_cli.py embed
+
+Input files are streamed, so memory stays flat regardless of archive size.
+Formats are picked from the extension: .jsonl (one object per line; the text
+is read from --field or the first of entry_text/entry/text/body), .csv
+(same column lookup) or plain text (entries separated by blank lines).
+A created_at field is stored as UTC "YYYY-MM-DD HH:MM:SS" (the format of
+SQLite's CURRENT_TIMESTAMP); ISO 8601 and day-first dates like 05/03/2024
+are recognised, --date-format names any other layout, and values that
+cannot be parsed fall back to the import time.
+Each chunk is classified with classify_batch and written in one transaction
+together with an import checkpoint, so an interrupted import resumes at the
+first uncommitted chunk when re-run.
+
+reclassify brings entries classified under an older label/threshold
+configuration up to date. Each entry's stored entailment logits are re-used,
+so threshold changes never touch the model and label changes only score the
+new or edited labels. Batches commit as they go, so it can be stopped and
+re-run at any time.
+
+embed stores a vector for every entry and goal that has none yet (entries
+saved before embeddings existed), so similar-entry search and semantic goal
+matching cover them too; it is resumable the same way.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterator, Optional, Tuple
+
+from database import (
+    DB_PATH,
+    DEFAULT_USER_ID,
+    SHARD_DIR,
+    ShardRouter,
+    apply_reclassification,
+    auto_process_entry_for_goals,
+    count_stale_entries,
+    get_entry_logits,
+    get_import_checkpoint,
+    get_or_create_user,
+    get_stale_entries,
+    init_db,
+    iter_entries,
+    save_entries,
+    set_import_checkpoint,
+    transaction,
+)
+
+TEXT_FIELDS = ("entry_text", "entry", "text", "body")
+EXPORT_FIELDS = ["entry_id", "created_at", "entry_text", "main_category", "secondary_category", "sub_category",
+                 "tags", "confidence_scores", "processing_time", "success", "error_message"]
+
+Record = Tuple[Optional[str], Optional[str]]  # (text, created_at)
+
+# Tried in order after ISO 8601; slashed dates are read day first
+DATE_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d",
+                "%d %B %Y", "%d %b %Y", "%B %d, %Y", "%b %d, %Y")
+
+
+def normalize_timestamp(value: Optional[str], date_format: Optional[str] = None) -> Optional[str]:
+    """Source timestamp as UTC 'YYYY-MM-DD HH:MM:SS', or None if it cannot be parsed."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    parsed = None
+    if date_format:
+        formats = (date_format,)
+    else:
+        formats = DATE_FORMATS
+        try:
+            parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith(("Z", "z")) else value)
+        except ValueError:
+            pass
+    for fmt in formats:
+        if parsed is not None:
+            break
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _pick(row: Dict, field: Optional[str]) -> Record:
+    if field:
+        text = row.get(field)
+    else:
+        text = next((row[f] for f in TEXT_FIELDS if row.get(f)), None)
+    return text, row.get("created_at") or None
+
+
+def read_jsonl(path: str, field: Optional[str]) -> Iterator[Record]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield _pick(json.loads(line), field) if line.strip() else (None, None)
+
+
+def read_csv(path: str, field: Optional[str]) -> Iterator[Record]:
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            yield _pick(row, field)
+
+
+def read_text(path: str, field: Optional[str] = None) -> Iterator[Record]:
+    buf = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                buf.append(line.rstrip("\n"))
+            elif buf:
+                yield "\n".join(buf), None
+                buf = []
+    if buf:
+        yield "\n".join(buf), None
+
+
+def read_records(path: str, field: Optional[str] = None) -> Iterator[Record]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return read_jsonl(path, field)
+    if ext == ".csv":
+        return read_csv(path, field)
+    return read_text(path, field)
+
+
+def import_file(path: str, classifier, chunk_size: int = 64, goals: bool = False, db_path: str = DB_PATH,
+                field: Optional[str] = None, restart: bool = False, log=sys.stderr,
+                user_id: int = DEFAULT_USER_ID, date_format: Optional[str] = None) -> int:
+    """Import one file for user_id; returns the number of entries written in this run."""
+    source = os.path.abspath(path) if user_id == DEFAULT_USER_ID else f"user:{user_id}:{os.path.abspath(path)}"
+    done = 0 if restart else get_import_checkpoint(source, db_path=db_path)
+    records = islice(read_records(path, field), done, None)
+    if done:
+        print(f"Resuming {path} after {done} records", file=log)
+
+    written, undated, t0 = 0, 0, time.time()
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        keep = []
+        for text, ts in chunk:
+            if not (text and text.strip()):
+                continue
+            created_at = normalize_timestamp(ts, date_format)
+            if created_at is None and ts and ts.strip():
+                undated += 1
+            keep.append((text, created_at))
+        results = classifier.classify_batch([text for text, _ in keep]) if keep else []
+        with transaction(db_path) as tx:
+            ids = save_entries(results, created_at=[ts for _, ts in keep], db_path=db_path, tx=tx, user_id=user_id)
+            if goals:
+                for entry_id, r in zip(ids, results):
+                    auto_process_entry_for_goals(entry_id, r.entry, r.main_category, r.sub_category,
+                                                 db_path=db_path, tx=tx, chunks=r.chunks, user_id=user_id)
+            done += len(chunk)
+            set_import_checkpoint(source, done, db_path=db_path, tx=tx)
+        written += len(ids)
+        rate = written / max(time.time() - t0, 1e-9)
+        print(f"{path}: {done} records read, {written} entries written ({rate:.1f}/s)", file=log)
+    if undated:
+        print(f"{path}: {undated} unrecognised created_at values were replaced by the import time", file=log)
+    return written
+
+
+def reclassify_entries(classifier, batch_size: int = 64, db_path: str = DB_PATH, log=sys.stderr,
+                       user_id: int = DEFAULT_USER_ID) -> int:
+    """Re-derive every stale entry of user_id under the classifier's current config; returns entries updated."""
+    version, scorer = classifier.config_key(), classifier.scorer_key()
+    total = count_stale_entries(version, db_path=db_path, user_id=user_id)
+    if not total:
+        print("All entries are up to date", file=log)
+        return 0
+    updated = scored = after = seen = 0
+    t0 = time.time()
+    while True:
+        batch = get_stale_entries(version, after_id=after, limit=batch_size, db_path=db_path, user_id=user_id)
+        if not batch:
+            break
+        ids = [entry_id for entry_id, _ in batch]
+        stored = get_entry_logits(ids, scorer, db_path=db_path)
+        logits = [stored.get(entry_id, []) for entry_id in ids]
+        results = classifier.classify_batch([text for _, text in batch], logits=logits)
+        with transaction(db_path) as tx:
+            for entry_id, old, r in zip(ids, logits, results):
+                if not r.success:
+                    continue
+                apply_reclassification(entry_id, r, db_path=db_path, tx=tx, user_id=user_id)
+                updated += 1
+                scored += sum(map(len, r.logits)) - sum(map(len, old))
+        after, seen = ids[-1], seen + len(ids)
+        rate = seen / max(time.time() - t0, 1e-9)
+        print(f"reclassify: {seen}/{total} entries, {updated} updated, {max(scored, 0)} labels scored by the model "
+              f"({rate:.1f}/s)", file=log)
+    return updated
+
+
+def export_entries(out, fmt: str = "jsonl", db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> int:
+    count = 0
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    for row in iter_entries(db_path, user_id=user_id):
+        if writer:
+            row["tags"] = ",".join(row["tags"])
+            row["confidence_scores"] = json.dumps(row["confidence_scores"])
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--user", default=None, help="username whose entries are imported/exported")
+    ap.add_argument("--shard-dir", default=SHARD_DIR,
+                    help="per-user database files (default: $DIARY_SHARD_DIR; see database.ShardRouter)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="classify and store entries from files")
+    imp.add_argument("paths", nargs="+")
+    imp.add_argument("--field", default=None, help="JSONL key / CSV column holding the entry text")
+    imp.add_argument("--chunk-size", type=int, default=64)
+    imp.add_argument("--goals", action="store_true", help="also run goal extraction for each entry")
+    imp.add_argument("--restart", action="store_true", help="ignore any saved checkpoint")
+    imp.add_argument("--date-format", default=None, help="strptime layout of created_at (default: ISO 8601 or day first)")
+    imp.add_argument("--backend", default=None, help="model backend (pytorch, quantized, onnx)")
+    imp.add_argument("--model-path", default=None)
+
+    rec = sub.add_parser("reclassify", help="re-apply changed labels/thresholds to stored entries")
+    rec.add_argument("--batch-size", type=int, default=64)
+    rec.add_argument("--backend", default=None, help="model backend (pytorch, quantized, onnx)")
+    rec.add_argument("--model-path", default=None)
+
+    emb = sub.add_parser("embed", help="store vectors for entries and goals that have none")
+    emb.add_argument("--batch-size", type=int, default=64)
+    emb.add_argument("--backend", default=None, help="model backend (pytorch, quantized)")
+    emb.add_argument("--model-path", default=None)
+
+    exp = sub.add_parser("export", help="stream stored entries to a file")
+    exp.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    exp.add_argument("-o", "--output", default="-")
+
+    args = ap.parse_args(argv)
+    init_db(args.db)
+    user_id = get_or_create_user(args.user, db_path=args.db) if args.user else DEFAULT_USER_ID
+    db_path = ShardRouter(args.db, shard_dir=args.shard_dir).path(user_id)
+
+    if args.command in ("import", "reclassify", "embed"):
+        from classifier import RobustJournalClassifier
+        kwargs = {k: v for k, v in (("backend", args.backend), ("model_path", args.model_path)) if v}
+        classifier = RobustJournalClassifier(**kwargs)
+    if args.command == "embed":
+        from similarity import backfill_embeddings
+        written = backfill_embeddings(classifier, batch_size=args.batch_size, db_path=db_path, user_id=user_id,
+                                      progress=lambda kind, n: print(f"embed: {n} {kind} vectors", file=sys.stderr))
+        print(f"Embedded {written.get('entry', 0)} entries and {written.get('goal', 0)} goals", file=sys.stderr)
+    elif args.command == "reclassify":
+        count = reclassify_entries(classifier, batch_size=args.batch_size, db_path=db_path, user_id=user_id)
+        print(f"Reclassified {count} entries", file=sys.stderr)
+    elif args.command == "import":
+        total = sum(import_file(p, classifier, chunk_size=args.chunk_size, goals=args.goals, db_path=db_path,
+                                field=args.field, restart=args.restart, user_id=user_id,
+                                date_format=args.date_format) for p in args.paths)
+        print(f"Imported {total} entries", file=sys.stderr)
+    else:
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+        try:
+            count = export_entries(out, args.format, db_path=db_path, user_id=user_id)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"Exported {count} entries", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,130 @@
 # goal_logic.py
+import json
+import os
 import re
+from dataclasses import dataclass
 from typing import List, Dict, Optional
 
-def _parse_money(text: str) -> Optional[float]:
-    m = re.search(r"(R|\$)?\s?(\d{1,3}(?:[,\s]\d{3})*|\d+)(?:[.,]\d+)?", text)
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "goal_rules.json")
+
+# A currency-prefixed or bare amount; thousands may be grouped with commas or spaces
+_MONEY = r"(?<![\w.,])(?:R|\$)?\s?(?:\d{1,3}(?:[,\s]\d{3})+(?!\d)|\d+)(?:[.,]\d+)?"
+_AMOUNT = re.compile(r"\d{1,3}(?:[,\s]\d{3})+(?!\d)|\d+")
+
+
+@dataclass
+class RuleMatch:
+    kind: str              # "intent", "keyword", "completion" or "money"
+    text: str
+    start: int
+    end: int
+    sub_category: Optional[str] = None
+
+
+class GoalRules:
+    """Goal keywords, intent phrases, completion patterns and money amounts compiled into one regex.
+
+    ``scan`` walks the text once; every alternative sits inside a lookahead so
+    overlapping matches (e.g. "i saved" and "saved") are all reported, and
+    phrases are word-bounded so "run" does not fire inside "running".
+    """
+
+    def __init__(self, intent_phrases: List[str], categories: List[Dict], completion_patterns: List[str]):
+        self.categories = categories
+        self._keyword_category: Dict[str, Dict] = {}
+        for cat in categories:
+            for kw in cat["keywords"]:
+                self._keyword_category.setdefault(kw.lower(), cat)
+
+        def literal(phrases):
+            return "|".join(re.escape(p.lower()) for p in sorted(phrases, key=len, reverse=True))
+
+        alternatives = []
+        if completion_patterns:
+            alternatives.append(r"\b(?P<completion>" + "|".join(f"(?:{p})" for p in completion_patterns) + r")\b")
+        if intent_phrases:
+            alternatives.append(r"\b(?P<intent>" + literal(intent_phrases) + r")\b")
+        if self._keyword_category:
+            alternatives.append(r"\b(?P<keyword>" + literal(self._keyword_category) + r")\b")
+        alternatives.append(f"(?P<money>{_MONEY})")
+        self._pattern = re.compile("(?=" + "|".join(alternatives) + ")", re.IGNORECASE)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GoalRules":
+        return cls(data.get("intent_phrases", []), data.get("categories", []), data.get("completion_patterns", []))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_RULES_PATH) -> "GoalRules":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def scan(self, text: str) -> List[RuleMatch]:
+        out = []
+        for m in self._pattern.finditer(text):
+            kind = m.lastgroup
+            start, end = m.span(kind)
+            value = m.group(kind)
+            if kind == "money" and not value.strip():
+                continue
+            sub = self._keyword_category[value.lower()]["sub_category"] if kind == "keyword" else None
+            out.append(RuleMatch(kind, value, start, end, sub))
+        return out
+
+    def category_for(self, matches: List[RuleMatch]) -> Optional[Dict]:
+        """Highest-priority (first listed) category with a keyword match."""
+        hit = {m.sub_category for m in matches if m.kind == "keyword"}
+        return next((cat for cat in self.categories if cat["sub_category"] in hit), None)
+
+
+_rules = GoalRules.load()
+
+
+def load_rules(path: str = DEFAULT_RULES_PATH) -> GoalRules:
+    """Replace the active rule table, e.g. with a deployment-specific JSON file."""
+    global _rules
+    _rules = GoalRules.load(path)
+    return _rules
+
+
+def scan_text(entry_text: str, rules: Optional[GoalRules] = None) -> List[RuleMatch]:
+    return (rules or _rules).scan(entry_text)
+
+
+def _amount(match: Optional[RuleMatch]) -> Optional[float]:
+    if match is None:
+        return None
+    m = _AMOUNT.search(match.text)
     if not m:
         return None
-    raw = m.group(2).replace(",", "").replace(" ", "")
+    raw = m.group(0).replace(",", "").replace(" ", "")
     try: return float(raw)
     except: return None
 
-def extract_goals_from_text(entry_text: str, main_category: str, sub_category: Optional[str]) -> List[Dict]:
-    text = entry_text.lower()
+
+def _parse_money(text: str) -> Optional[float]:
+    return _amount(next((m for m in scan_text(text) if m.kind == "money"), None))
+
+
+def extract_goals_from_text(entry_text: str, main_category: str, sub_category: Optional[str],
+                            rules: Optional[GoalRules] = None) -> List[Dict]:
+    rules = rules or _rules
+    matches = rules.scan(entry_text)
     out: List[Dict] = []
 
-    looks_like_goal = main_category == "Goals" or any(kw in text for kw in ["i want to", "my goal is", "i plan to", "i will", "i'm going to"])
+    looks_like_goal = main_category == "Goals" or any(m.kind == "intent" for m in matches)
     if not looks_like_goal: return out
 
-    if any(k in text for k in ["save", "savings", "emergency fund", "budget"]):
-        amount = _parse_money(text)
-        out.append({"goal_text": entry_text.strip(), "category":"Goals", "sub_category":"Savings/Finance", "target_amount": amount, "status":"planned"})
-        return out
-    if any(k in text for k in ["learn", "course", "study", "class", "certificate"]):
-        out.append({"goal_text": entry_text.strip(), "category":"Goals","sub_category":"Education/Learning","status":"planned"})
-        return out
-    if any(k in text for k in ["run", "gym", "workout", "exercise", "marathon", "steps"]):
-        out.append({"goal_text": entry_text.strip(), "category":"Goals","sub_category":"Health/Fitness","status":"planned"})
-        return out
-    if any(k in text for k in ["every day", "daily", "habit", "consistency", "routine"]):
-        out.append({"goal_text": entry_text.strip(),"category":"Goals","sub_category":"Habit Building","status":"planned"})
+    cat = rules.category_for(matches)
+    if cat is not None:
+        goal = {"goal_text": entry_text.strip(), "category": "Goals", "sub_category": cat["sub_category"], "status": "planned"}
+        if cat.get("parse_amount"):
+            goal["target_amount"] = _amount(next((m for m in matches if m.kind == "money"), None))
+        out.append(goal)
         return out
     # fallback
     out.append({"goal_text": entry_text.strip(),"category":"Goals","sub_category":sub_category or None,"status":"planned"})
     return out
 
-def detect_goal_completion_mentions(entry_text: str) -> List[str]:
-    text = entry_text.lower()
-    patterns = [
-        r"\bi (finally )?(finished|completed|achieved|reached|hit|nailed)\b",
-        r"\bi saved\b",
-        r"\bgoal (done|complete|achieved)\b",
-    ]
-    hits = []
-    for p in patterns:
-        if re.search(p, text):
-            hits.append(p)
-    return hits
+
+def detect_goal_completion_mentions(entry_text: str, rules: Optional[GoalRules] = None) -> List[str]:
+    return [m.text for m in scan_text(entry_text, rules) if m.kind == "completion"]
@@ -0,0 +1,170 @@
+# ingestion.py
+import logging
+import threading
+from typing import List, Optional
+
+from database import (
+    DB_PATH,
+    DEFAULT_USER_ID,
+    ShardRouter,
+    auto_process_entry_for_goals,
+    claim_jobs,
+    complete_job,
+    enqueue_entry,
+    fail_job,
+    get_jobs,
+    record_done_job,
+    requeue_stale_jobs,
+    save_embeddings,
+    save_entry,
+    save_entry_metrics,
+    transaction,
+)
+from metrics import span, trace
+from similarity import embed_texts, to_blob
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionWorker:
+    """Background pool that drains the ingest_jobs queue.
+
+    Each worker thread claims up to ``batch_size`` pending jobs, classifies
+    them with one ``classify_batch`` call, then saves each entry and runs goal
+    extraction in a single transaction per job. Jobs live in SQLite, so work
+    submitted before a crash is picked up again on the next start. With
+    ``embed=True`` each entry's vector is stored and used for goal matching.
+    Each entry's stage timings (classification, embedding, DB write, goal
+    processing) are stored in entry_metrics next to it.
+
+    The queue lives in ``db_path`` and holds jobs of every user; with a
+    sharded ``router`` each entry is written to its user's shard.
+    """
+
+    def __init__(self, classifier, db_path: str = DB_PATH, batch_size: int = 16, num_workers: int = 1,
+                 poll_interval: float = 1.0, max_attempts: int = 3, embed: bool = True,
+                 router: Optional[ShardRouter] = None):
+        self.classifier = classifier
+        self.db_path = db_path
+        self.router = router or ShardRouter(db_path, shard_dir=None)
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.embed = embed
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "IngestionWorker":
+        if self._threads:
+            return self
+        requeued = requeue_stale_jobs(db_path=self.db_path)
+        if requeued:
+            logger.info("Requeued %d stale ingestion jobs", requeued)
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"ingestion-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, entry_text: str, user_id: int = DEFAULT_USER_ID) -> int:
+        """Store the raw entry as a pending job and return its job_id immediately."""
+        job_id = enqueue_entry(entry_text, db_path=self.db_path, user_id=user_id)
+        self._wake.set()
+        return job_id
+
+    def process_once(self) -> int:
+        """Claim and process one batch; returns the number of jobs handled."""
+        jobs = claim_jobs(self.batch_size, db_path=self.db_path)
+        if not jobs:
+            return 0
+        try:
+            results = self.classifier.classify_batch([text for _, _, text in jobs])
+        except Exception as e:
+            logger.exception("Batch classification failed")
+            for job_id, _, _ in jobs:
+                fail_job(job_id, str(e), max_attempts=self.max_attempts, db_path=self.db_path)
+            return len(jobs)
+        handled = len(jobs)
+        # classify_batch reports model errors as unsuccessful results rather than raising;
+        # those jobs are retried, not saved
+        ok = []
+        for job, result in zip(jobs, results):
+            if result.success:
+                ok.append((job, result))
+            else:
+                fail_job(job[0], result.error_message or "Classification failed", max_attempts=self.max_attempts,
+                         db_path=self.db_path)
+        if not ok:
+            return handled
+        jobs, results = [job for job, _ in ok], [result for _, result in ok]
+
+        vectors = None
+        embed_ms = 0.0
+        if self.embed:
+            with trace() as tr:
+                try:
+                    with span("embed"):
+                        vectors = embed_texts(self.classifier, [text for _, _, text in jobs])
+                except Exception:
+                    logger.exception("Embedding failed; falling back to keyword goal matching")
+            embed_ms = tr.spans.get("embed", 0.0) / len(jobs)
+        vectors = vectors or [None] * len(jobs)
+
+        for (job_id, user_id, _), result, vector in zip(jobs, results, vectors):
+            try:
+                shard = self.router.path(user_id)
+                if shard == self.db_path:
+                    with transaction(self.db_path) as tx:
+                        entry_id = self._save(result, vector, embed_ms, user_id, tx)
+                        complete_job(job_id, entry_id, db_path=self.db_path, tx=tx)
+                    continue
+                # Shard and queue are separate files: the shard records the job with the entry,
+                # so a retry after a crash between the two commits does not save it twice
+                done = get_jobs([job_id], db_path=shard, user_id=user_id)
+                if done:
+                    entry_id = done[0]["entry_id"]
+                else:
+                    with transaction(shard) as tx:
+                        entry_id = self._save(result, vector, embed_ms, user_id, tx)
+                        record_done_job(job_id, result.entry, entry_id, db_path=shard, tx=tx, user_id=user_id)
+                complete_job(job_id, entry_id, db_path=self.db_path)
+            except Exception as e:
+                logger.exception("Ingestion job %s failed", job_id)
+                fail_job(job_id, str(e), max_attempts=self.max_attempts, db_path=self.db_path)
+        return handled
+
+    def _save(self, result, vector, embed_ms: float, user_id: int, tx) -> int:
+        """Save one classified entry with its embedding, goals and stage timings inside tx."""
+        with trace() as tr:
+            entry_id = save_entry(result, db_path=tx.db_path, tx=tx, user_id=user_id)
+            if vector is not None:
+                save_embeddings("entry", [(entry_id, to_blob(vector))], len(vector), db_path=tx.db_path, tx=tx,
+                                user_id=user_id)
+            auto_process_entry_for_goals(
+                entry_id, result.entry, result.main_category, result.sub_category, db_path=tx.db_path, tx=tx,
+                embedding=vector, chunks=result.chunks, user_id=user_id
+            )
+        timings = dict(result.stage_timings, **tr.rounded())
+        if embed_ms:
+            timings["embed"] = round(embed_ms, 3)
+        save_entry_metrics(entry_id, timings, db_path=tx.db_path, tx=tx)
+        return entry_id
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                if self.process_once():
+                    continue
+            except Exception:
+                logger.exception("Ingestion worker error")
+            self._wake.wait(self.poll_interval)
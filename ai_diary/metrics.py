@@ -0,0 +1,172 @@
+# metrics.py
+"""Lightweight stage timing.
+
+``span(name)`` times a block. The duration goes into the innermost active
+``trace()`` on the current thread and into process-wide histograms that
+``render_prometheus()`` / ``serve_metrics()`` expose.
+
+Set DIARY_PROFILE=cprofile to dump a cProfile file for every top-level trace
+(into DIARY_PROFILE_DIR, default ./profiles). Set DIARY_PROFILE=tracemalloc to
+record each trace's peak Python allocation as ``tracemalloc_peak_kb``. Both
+hooks are process-wide, so only one trace is profiled at a time; top-level
+traces that start on other threads meanwhile run unprofiled.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+PROFILE_MODE = os.environ.get("DIARY_PROFILE", "").lower()
+PROFILE_DIR = os.environ.get("DIARY_PROFILE_DIR", "profiles")
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_local = threading.local()
+_lock = threading.Lock()
+# Held by the trace currently being profiled
+_profile_lock = threading.Lock()
+# stage -> {"count", "sum_ms", "buckets": cumulative counts aligned with BUCKETS_MS}
+_stats: Dict[str, Dict] = {}
+
+
+class Trace:
+    """Per-request collection of stage durations (ms) and other measurements."""
+
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+
+    def add(self, name: str, value: float):
+        self.spans[name] = self.spans.get(name, 0.0) + value
+
+    def rounded(self, digits: int = 3) -> Dict[str, float]:
+        return {k: round(v, digits) for k, v in self.spans.items()}
+
+
+def current_trace() -> Optional[Trace]:
+    return getattr(_local, "trace", None)
+
+
+def record(name: str, ms: float):
+    trace_ = current_trace()
+    if trace_ is not None:
+        trace_.add(name, ms)
+    with _lock:
+        s = _stats.get(name)
+        if s is None:
+            s = _stats[name] = {"count": 0, "sum_ms": 0.0, "buckets": [0] * len(BUCKETS_MS)}
+        s["count"] += 1
+        s["sum_ms"] += ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                s["buckets"][i] += 1
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - t0) * 1000)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Collect the spans of everything run inside the block on this thread."""
+    parent = current_trace()
+    t = Trace()
+    _local.trace = t
+    profiler = _start_profile() if parent is None else None
+    try:
+        yield t
+    finally:
+        _stop_profile(profiler, t)
+        _local.trace = parent
+        if parent is not None:
+            for k, v in t.spans.items():
+                parent.add(k, v)
+
+
+def _start_profile():
+    if PROFILE_MODE not in ("cprofile", "tracemalloc") or not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        if PROFILE_MODE == "cprofile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        return "tracemalloc"
+    except Exception:
+        _profile_lock.release()
+        raise
+
+
+def _stop_profile(profiler, t: Trace):
+    if profiler is None:
+        return
+    try:
+        if profiler == "tracemalloc":
+            import tracemalloc
+            t.add("tracemalloc_peak_kb", tracemalloc.get_traced_memory()[1] / 1024)
+            return
+        profiler.disable()
+    finally:
+        _profile_lock.release()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{id(t):x}.prof"))
+
+
+def snapshot() -> Dict[str, Dict]:
+    with _lock:
+        return {name: {"count": s["count"], "sum_ms": round(s["sum_ms"], 3),
+                       "mean_ms": round(s["sum_ms"] / s["count"], 3) if s["count"] else 0.0}
+                for name, s in _stats.items()}
+
+
+def render_prometheus() -> str:
+    """Stage histograms in the Prometheus text exposition format."""
+    lines: List[str] = [
+        "# HELP diary_stage_duration_ms Time spent per processing stage.",
+        "# TYPE diary_stage_duration_ms histogram",
+    ]
+    with _lock:
+        for name, s in sorted(_stats.items()):
+            for bound, count in zip(BUCKETS_MS, s["buckets"]):
+                lines.append(f'diary_stage_duration_ms_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'diary_stage_duration_ms_bucket{{stage="{name}",le="+Inf"}} {s["count"]}')
+            lines.append(f'diary_stage_duration_ms_sum{{stage="{name}"}} {s["sum_ms"]:.3f}')
+            lines.append(f'diary_stage_duration_ms_count{{stage="{name}"}} {s["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, ctype = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, ctype = json.dumps(snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics (Prometheus) and /metrics.json from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,109 @@
+# model_loader.py
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from zero_shot import ZeroShotEngine
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "facebook/bart-large-mnli"
+# "pytorch": full-precision weights (GPU if available)
+# "quantized": int8 dynamically quantized Linear layers, CPU only
+# "onnx": an exported ONNX graph loaded from a local directory through onnxruntime
+BACKENDS = ("pytorch", "quantized", "onnx")
+DEFAULT_BACKEND = os.environ.get("DIARY_MODEL_BACKEND", "pytorch")
+DEFAULT_MODEL_PATH = os.environ.get("DIARY_MODEL_PATH") or None
+
+# Process-wide registry so every classifier instance shares one loaded model
+_engines: Dict[Tuple[str, str], ZeroShotEngine] = {}
+_errors: Dict[Tuple[str, str], str] = {}
+_threads: Dict[Tuple[str, str], threading.Thread] = {}
+_lock = threading.Lock()
+_threads_lock = threading.Lock()
+
+
+def _key(backend: str, model_path: Optional[str]) -> Tuple[str, str]:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "onnx" and not model_path:
+        raise ValueError("The onnx backend needs model_path pointing at an exported model directory")
+    return backend, model_path or MODEL_NAME
+
+
+def _load(backend: str, path: str) -> ZeroShotEngine:
+    from transformers import AutoTokenizer
+
+    t0 = time.time()
+    logger.info("Loading zero-shot model (%s, %s)…", backend, path)
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        model = ORTModelForSequenceClassification.from_pretrained(path)
+    else:
+        import torch
+        from transformers import AutoModelForSequenceClassification
+        model = AutoModelForSequenceClassification.from_pretrained(path)
+        model.eval()
+        if backend == "quantized":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif torch.cuda.is_available():
+            model = model.to("cuda")
+    logger.info("Model loaded in %.1fs", time.time() - t0)
+    return ZeroShotEngine(model, tokenizer)
+
+
+def get_engine(backend: str = DEFAULT_BACKEND, model_path: Optional[str] = DEFAULT_MODEL_PATH) -> ZeroShotEngine:
+    """Return the shared engine for a backend, loading it on first use."""
+    key = _key(backend, model_path)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    with _lock:
+        if key not in _engines:
+            try:
+                _engines[key] = _load(*key)
+                _errors.pop(key, None)
+            except Exception as e:
+                _errors[key] = str(e)
+                raise
+        return _engines[key]
+
+
+def warmup(backend: str = DEFAULT_BACKEND, model_path: Optional[str] = DEFAULT_MODEL_PATH) -> threading.Thread:
+    """Start loading the model in a daemon thread; safe to call on every rerun."""
+    key = _key(backend, model_path)
+    with _threads_lock:
+        thread = _threads.get(key)
+        if thread is None or (not thread.is_alive() and key in _errors):
+            _errors.pop(key, None)
+
+            def run():
+                try:
+                    get_engine(backend, model_path)
+                except Exception:
+                    logger.exception("Model warmup failed")
+
+            thread = threading.Thread(target=run, name=f"model-warmup-{backend}", daemon=True)
+            _threads[key] = thread
+            thread.start()
+    return thread
+
+
+def model_status(backend: str = DEFAULT_BACKEND, model_path: Optional[str] = DEFAULT_MODEL_PATH) -> str:
+    """Readiness probe: "ready", "loading", "failed: <reason>" or "idle"."""
+    key = _key(backend, model_path)
+    if key in _engines:
+        return "ready"
+    if key in _errors:
+        return f"failed: {_errors[key]}"
+    thread = _threads.get(key)
+    if thread is not None and thread.is_alive():
+        return "loading"
+    return "idle"
+
+
+def is_ready(backend: str = DEFAULT_BACKEND, model_path: Optional[str] = DEFAULT_MODEL_PATH) -> bool:
+    return model_status(backend, model_path) == "ready"
@@ -0,0 +1,274 @@
+# similarity.py
+import math
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import (
+    DB_PATH,
+    DEFAULT_USER_ID,
+    embedding_ids,
+    embeddings_version,
+    get_conn,
+    get_embedding,
+    get_unembedded,
+    load_embeddings,
+    save_embeddings,
+)
+
+# Mean-pooled encoder states are anisotropic: unrelated texts already have a high
+# raw cosine. Goal matching therefore compares vectors after subtracting the
+# user's mean entry vector, and only once there are enough entries to estimate it.
+GOAL_MIN_SIMILARITY = float(os.environ.get("DIARY_GOAL_MIN_SIMILARITY", "0.6"))
+MIN_CENTERING_ENTRIES = 50
+
+
+def to_blob(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.maximum(norms, 1e-12)
+
+
+class _Snapshot(NamedTuple):
+    version: Tuple[int, int]
+    ids: np.ndarray
+    matrix: np.ndarray  # rows are unit vectors; a view into the index's buffer
+    total: Optional[np.ndarray]  # sum of the rows, for the mean direction
+    centroids: Optional[np.ndarray]
+    lists: Tuple[np.ndarray, ...]
+    trained_on: int  # row count the IVF centroids were trained on
+
+
+_EMPTY = _Snapshot((0, 0), np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), None, None, (), 0)
+
+
+class EmbeddingIndex:
+    """Top-k cosine search over one user's stored vectors of one kind ("entry" or "goal").
+
+    Small collections are searched exactly with one matrix-vector product.
+    From ``ivf_threshold`` vectors on, an IVF index is built: vectors are
+    partitioned by spherical k-means into ~sqrt(n) lists and a query only
+    scores the lists of its ``nprobe`` nearest centroids.
+
+    ``refresh`` only loads rows added since the last call (appended to a
+    growable buffer and to their nearest IVF list) and drops deleted rows
+    without reloading the rest; k-means is re-trained once the collection has
+    doubled. Readers use one immutable snapshot, swapped in atomically.
+    """
+
+    def __init__(self, kind: str, db_path: str = DB_PATH, ivf_threshold: int = 20000, nprobe: int = 8,
+                 user_id: int = DEFAULT_USER_ID):
+        self.kind = kind
+        self.db_path = db_path
+        self.user_id = user_id
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._state = _EMPTY
+        self._buf = np.empty((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._state.ids
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._state.matrix
+
+    def mean(self) -> Optional[np.ndarray]:
+        """Mean of the stored unit vectors (their common direction), None when empty."""
+        state = self._state
+        return state.total / len(state.ids) if len(state.ids) else None
+
+    def refresh(self) -> "EmbeddingIndex":
+        """Pick up rows added or removed since the last refresh."""
+        version = embeddings_version(self.kind, db_path=self.db_path, user_id=self.user_id)
+        if version == self._state.version:
+            return self
+        with self._lock:
+            state = self._state
+            if version == state.version:
+                return self
+            last = int(state.ids[-1]) if len(state.ids) else 0
+            rows = load_embeddings(self.kind, db_path=self.db_path, user_id=self.user_id, after_id=last)
+            ids, matrix, total = state.ids, state.matrix, state.total
+            if len(ids) + len(rows) != version[0]:
+                current = np.array(embedding_ids(self.kind, db_path=self.db_path, user_id=self.user_id),
+                                   dtype=np.int64)
+                known = np.concatenate([ids, np.array([r[0] for r in rows], dtype=np.int64)])
+                if np.isin(current, known, invert=True).any():
+                    # Rows stored below the last loaded id (a backfill): load everything once
+                    rows = load_embeddings(self.kind, db_path=self.db_path, user_id=self.user_id)
+                    ids, matrix, total = _EMPTY.ids, _EMPTY.matrix, None
+                    self._buf = np.empty((0, 0), dtype=np.float32)
+                else:
+                    ids, matrix, total = self._compact(ids, matrix, current)
+            added = len(rows)
+            if rows:
+                ids, matrix, total = self._append(ids, matrix, total, rows)
+            self._state = self._index(version, ids, matrix, total, state, added)
+        return self
+
+    def _compact(self, ids: np.ndarray, matrix: np.ndarray, current: np.ndarray):
+        """Drop rows no longer in the database, without reloading the others."""
+        keep = np.isin(ids, current)
+        ids = ids[keep]
+        # A fresh buffer: published snapshots keep reading the old one
+        self._buf = np.array(matrix[keep], dtype=np.float32)
+        matrix = self._buf[:len(ids)]
+        return ids, matrix, matrix.sum(axis=0) if len(ids) else None
+
+    def _append(self, ids: np.ndarray, matrix: np.ndarray, total: Optional[np.ndarray], rows):
+        new = _normalize(np.vstack([from_blob(r[1]) for r in rows]))
+        n, k = len(ids), len(new)
+        if self._buf.shape[0] < n + k or self._buf.shape[1] != new.shape[1]:
+            # Grow geometrically so appends are amortized O(k); rows beyond n are
+            # never visible to published snapshots, so writing them is safe
+            buf = np.empty((max(2 * self._buf.shape[0], n + k, 64), new.shape[1]), dtype=np.float32)
+            if n:
+                buf[:n] = matrix
+            self._buf = buf
+        self._buf[n:n + k] = new
+        ids = np.concatenate([ids, np.array([r[0] for r in rows], dtype=np.int64)])
+        total = new.sum(axis=0) if total is None else total + new.sum(axis=0)
+        return ids, self._buf[:n + k], total
+
+    def _index(self, version, ids, matrix, total, old: _Snapshot, added: int) -> _Snapshot:
+        n = len(ids)
+        if n < self.ivf_threshold:
+            return _Snapshot(version, ids, matrix, total, None, (), 0)
+        if old.centroids is None or n >= 2 * old.trained_on or len(old.ids) + added != n:
+            centroids, lists = self._train(matrix)
+            return _Snapshot(version, ids, matrix, total, centroids, lists, n)
+        # Only appended rows: place each in its nearest list
+        start = n - added
+        assign = np.argmax(matrix[start:] @ old.centroids.T, axis=1)
+        lists = list(old.lists)
+        for c in np.unique(assign):
+            lists[c] = np.concatenate([lists[c], start + np.flatnonzero(assign == c)])
+        return _Snapshot(version, ids, matrix, total, old.centroids, tuple(lists), old.trained_on)
+
+    def _train(self, matrix: np.ndarray, iterations: int = 8, seed: int = 0):
+        n = len(matrix)
+        nlist = max(1, int(math.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        centroids = matrix[rng.choice(n, nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(matrix @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, matrix)
+            filled = np.bincount(assign, minlength=nlist) > 0
+            centroids[filled] = _normalize(sums[filled])
+        assign = np.argmax(matrix @ centroids.T, axis=1)
+        return centroids, tuple(np.flatnonzero(assign == c) for c in range(nlist))
+
+    def search(self, vector, k: int = 5, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Return up to k (item_id, cosine similarity) pairs, best first."""
+        state = self._state
+        if len(state.ids) == 0:
+            return []
+        q = _normalize(np.asarray(vector, dtype=np.float32))
+        if state.centroids is not None:
+            probe = np.argsort(state.centroids @ q)[::-1][:self.nprobe]
+            rows = np.concatenate([state.lists[c] for c in probe])
+        else:
+            rows = np.arange(len(state.ids))
+        excluded = set(exclude)
+        if excluded:
+            rows = rows[~np.isin(state.ids[rows], list(excluded))]
+        if len(rows) == 0:
+            return []
+        scores = state.matrix[rows] @ q
+        top = np.argpartition(-scores, min(k, len(rows)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(state.ids[rows[i]]), float(scores[i])) for i in top]
+
+
+_indexes: Dict[Tuple[str, str, int], EmbeddingIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(kind: str, db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID) -> EmbeddingIndex:
+    """Process-wide index for one user's vectors of kind, refreshed against the database on each call."""
+    key = (db_path, kind, user_id)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = EmbeddingIndex(kind, db_path, user_id=user_id)
+    return index.refresh()
+
+
+def similar_entries(entry_id: int, k: int = 5, db_path: str = DB_PATH,
+                    user_id: int = DEFAULT_USER_ID) -> List[Tuple[int, float]]:
+    blob = get_embedding("entry", entry_id, db_path=db_path, user_id=user_id)
+    if blob is None:
+        return []
+    return get_index("entry", db_path, user_id).search(from_blob(blob), k=k, exclude=[entry_id])
+
+
+def find_similar_goals(vector, db_path: str = DB_PATH, k: int = 5, min_similarity: float = GOAL_MIN_SIMILARITY,
+                       exclude_status: Optional[str] = None, user_id: int = DEFAULT_USER_ID) -> List[Tuple[int, str]]:
+    """(goal_id, goal_text) of the user's goals semantically close to vector, best first.
+
+    Similarity is the cosine of the vectors centered on the user's mean entry
+    vector; with fewer than MIN_CENTERING_ENTRIES entries nothing is returned.
+    """
+    entries = get_index("entry", db_path, user_id)
+    goals = get_index("goal", db_path, user_id)
+    center = entries.mean()
+    if len(entries.ids) < MIN_CENTERING_ENTRIES or center is None or not len(goals.ids):
+        return []
+    q = _normalize(np.asarray(vector, dtype=np.float32)) - center
+    goal_vectors = goals.matrix - center  # the user's goals: a small matrix, scored exactly
+    scores = goal_vectors @ q / np.maximum(np.linalg.norm(goal_vectors, axis=1) * np.linalg.norm(q), 1e-12)
+    top = [i for i in np.argsort(-scores)[:k] if scores[i] >= min_similarity]
+    hits = [int(goals.ids[i]) for i in top]
+    if not hits:
+        return []
+    cur = get_conn(db_path).cursor()
+    cur.execute(f"""
+    SELECT goal_id, goal_text, status FROM goals WHERE user_id = ? AND goal_id IN ({','.join('?' * len(hits))})
+    """, [user_id, *hits])
+    rows = {r[0]: r for r in cur.fetchall()}
+    return [(gid, rows[gid][1]) for gid in hits
+            if gid in rows and (exclude_status is None or rows[gid][2] != exclude_status)]
+
+
+def embed_texts(classifier, texts: Sequence[str]) -> Optional[List[np.ndarray]]:
+    """Embed with the classifier's encoder; None when the backend cannot produce embeddings."""
+    try:
+        return [np.asarray(v, dtype=np.float32) for v in classifier.embed(list(texts))]
+    except NotImplementedError:
+        return None
+
+
+def backfill_embeddings(classifier, kinds: Sequence[str] = ("entry", "goal"), batch_size: int = 64,
+                        db_path: str = DB_PATH, user_id: int = DEFAULT_USER_ID,
+                        progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, int]:
+    """Embed the user's entries and goals that have no stored vector; returns vectors written per kind."""
+    written = {}
+    for kind in kinds:
+        after, written[kind] = 0, 0
+        while True:
+            batch = get_unembedded(kind, after_id=after, limit=batch_size, db_path=db_path, user_id=user_id)
+            if not batch:
+                break
+            vectors = embed_texts(classifier, [text for _, text in batch])
+            if vectors is None:
+                return written
+            save_embeddings(kind, [(item_id, to_blob(v)) for (item_id, _), v in zip(batch, vectors)],
+                            len(vectors[0]), db_path=db_path, user_id=user_id)
+            after = batch[-1][0]
+            written[kind] += len(batch)
+            if progress:
+                progress(kind, written[kind])
+    return written
@@ -0,0 +1,70 @@
+"""The goal rules (goal_rules.json) are compiled into one regex; these pin down
+its word boundaries, overlapping matches and completion detection."""
+import pytest
+
+from goal_logic import GoalRules, detect_goal_completion_mentions, extract_goals_from_text, scan_text
+
+
+def _keywords(text):
+    return [m.text.lower() for m in scan_text(text) if m.kind == "keyword"]
+
+
+@pytest.mark.parametrize("text", ["I'm running late again", "Brunch with the team", "A classical concert"])
+def test_keywords_do_not_match_inside_words(text):
+    assert _keywords(text) == []
+
+
+def test_keyword_matches_whole_word():
+    assert _keywords("I want to run every morning") == ["run"]
+    assert _keywords("Going to the gym.") == ["gym"]
+
+
+def test_save_and_saved_are_distinct():
+    assert _keywords("I saved R500 this month") == ["saved"]
+    assert _keywords("I want to save R500") == ["save"]
+
+
+def test_running_late_is_not_a_fitness_goal():
+    goals = extract_goals_from_text("I want to stop running late", "Goals", None)
+    assert [g["sub_category"] for g in goals] == [None]
+    goals = extract_goals_from_text("I want to run a 10km race", "Plans", None)
+    assert [g["sub_category"] for g in goals] == ["Health/Fitness"]
+
+
+def test_savings_goal_parses_amount():
+    (goal,) = extract_goals_from_text("My goal is to save R5 000 for a car", "Goals", None)
+    assert goal["sub_category"] == "Savings/Finance"
+    assert goal["target_amount"] == 5000.0
+
+
+def test_no_goal_without_intent_or_goals_category():
+    assert extract_goals_from_text("Went for a run", "Health", None) == []
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I finally finished the course!", ["I finally finished"]),
+    ("Today I completed my first 5km", ["I completed"]),
+    ("I saved R500 this month", ["I saved"]),
+    ("Goal achieved, time to celebrate", ["Goal achieved"]),
+    ("I will finish it tomorrow", []),
+    ("The unsaved draft was lost", []),
+])
+def test_detect_goal_completion_mentions(text, expected):
+    assert detect_goal_completion_mentions(text) == expected
+
+
+def test_overlapping_matches_are_all_reported():
+    kinds = {(m.kind, m.text) for m in scan_text("I saved R1,200.50")}
+    assert {("completion", "I saved"), ("keyword", "saved"), ("money", "R1,200.50")} <= kinds
+
+
+def test_custom_rules():
+    rules = GoalRules.from_dict({
+        "intent_phrases": ["i hope to"],
+        "categories": [{"sub_category": "Travel", "keywords": ["trip"]}],
+        "completion_patterns": ["booked it"],
+    })
+    (goal,) = extract_goals_from_text("I hope to take a trip", "Reflection", None, rules=rules)
+    assert goal["sub_category"] == "Travel"
+    assert detect_goal_completion_mentions("Finally booked it", rules=rules) == ["booked it"]
+    assert extract_goals_from_text("Planning a tripod purchase", "Reflection", None, rules=rules) == []
@@ -0,0 +1,101 @@
+"""The compact-storage migration (10) is one-way: it drops the tags table and the
+JSON confidence_scores column, so a database written by the original schema must
+come out of init_db with the same scores, tags and rollups."""
+import json
+import sqlite3
+
+import pytest
+
+import database as db
+from classifier import ClassificationResult
+
+LEGACY_ENTRIES = [
+    ("I want to save money for a car", "Goals", "Plans", "Savings/Finance", {"Goals": 0.61, "Plans": 0.27}),
+    ("Today I felt calm after the walk", "Emotions", None, "Calm", {"Emotions": 0.8, "Health": 0.12}),
+    ("Tomorrow: bank, then groceries", "Plans", None, None, {"Plans": 0.55, "Goals": 0.3}),
+    ("Classification failed for this one", "Unknown", None, None, None),
+]
+
+
+@pytest.fixture(autouse=True)
+def _close_pool():
+    yield
+    db.close_conns()
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A database as the original schema wrote it (user_version 0, tags table, JSON scores)."""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(db.BASE_SCHEMA)
+    conn.execute("INSERT INTO users (user_id, username) VALUES (?, 'default_user')", (db.DEFAULT_USER_ID,))
+    for text, main, secondary, sub, scores in LEGACY_ENTRIES:
+        cur = conn.execute(
+            "INSERT INTO entries (user_id, entry_text, main_category, secondary_category, sub_category, "
+            "confidence_scores, created_at) VALUES (?, ?, ?, ?, ?, ?, '2024-03-01 09:00:00')",
+            (db.DEFAULT_USER_ID, text, main, secondary, sub, json.dumps(scores) if scores else None))
+        conn.executemany("INSERT INTO tags (entry_id, tag) VALUES (?, ?)",
+                         [(cur.lastrowid, tag) for tag in (main, secondary, sub) if tag])
+    conn.commit()
+    conn.close()
+    db.init_db(path)
+    return path
+
+
+def test_legacy_schema_is_replaced(legacy_db):
+    conn = db.get_conn(legacy_db)
+    assert db.schema_version(legacy_db) == len(db.MIGRATIONS)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'tags'").fetchone() is None
+    assert "confidence_scores" not in {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+    # The compaction is followed by a VACUUM, so the dropped data leaves no free pages behind
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_scores_and_tags_round_trip(legacy_db):
+    entries = list(db.iter_entries(legacy_db))
+    assert [e["entry_text"] for e in entries] == [text for text, *_ in LEGACY_ENTRIES]
+    for entry, (_, main, secondary, sub, scores) in zip(entries, LEGACY_ENTRIES):
+        assert entry["tags"] == [tag for tag in (main, secondary, sub) if tag]
+        assert entry["confidence_scores"] == pytest.approx(scores or {})
+
+
+def test_main_confidence_feeds_rollups(legacy_db):
+    conn = db.get_conn(legacy_db)
+    confidence = dict(conn.execute("SELECT entry_text, main_confidence FROM entries").fetchall())
+    for text, main, _, _, scores in LEGACY_ENTRIES:
+        assert confidence[text] == pytest.approx((scores or {}).get(main, 0.0))
+    stats = {row[0]: row[1:] for row in conn.execute(
+        "SELECT main_category, entry_count, confidence_sum FROM daily_category_stats WHERE day = '2024-03-01'")}
+    assert stats["Goals"] == (1, pytest.approx(0.61))
+    assert stats["Plans"] == (1, pytest.approx(0.55))
+
+
+def test_entries_df_columns(legacy_db):
+    pytest.importorskip("pandas")
+    df = db.get_entries_df(legacy_db)
+    assert "confidence_scores" not in df.columns
+    assert {"tags", "main_confidence", "score_Goals", "score_Emotions"} <= set(df.columns)
+    goals = df[df["main_category"] == "Goals"].iloc[0]
+    assert goals["tags"] == ["Goals", "Plans", "Savings/Finance"]
+    assert goals["score_Goals"] == pytest.approx(0.61)
+
+
+def _tags(path, entry_id):
+    return next(e["tags"] for e in db.iter_entries(path) if e["entry_id"] == entry_id)
+
+
+def test_update_entry_rewrites_tags(legacy_db):
+    db.update_entry(1, "So happy today", "Emotions", None, "Joy", {"Emotions": 0.9}, db_path=legacy_db)
+    assert _tags(legacy_db, 1) == ["Emotions", "Joy"]
+    conn = db.get_conn(legacy_db)
+    assert conn.execute("SELECT COUNT(*) FROM entry_tags WHERE entry_id = 1").fetchone()[0] == 2
+
+
+def test_apply_reclassification_rewrites_tags(legacy_db):
+    result = ClassificationResult(entry="Tomorrow: bank, then groceries", main_category="Plans",
+                                  secondary_category="Goals", sub_category="Errands",
+                                  confidence_scores={"Plans": 0.7, "Goals": 0.4}, config_version="v2")
+    db.apply_reclassification(3, result, db_path=legacy_db)
+    assert _tags(legacy_db, 3) == ["Plans", "Goals", "Errands"]
+    assert db.count_stale_entries("v2", db_path=legacy_db) == len(LEGACY_ENTRIES) - 1
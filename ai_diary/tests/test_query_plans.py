@@ -0,0 +1,84 @@
+"""Request-path queries must be answered from indexes, never by a full table scan.
+
+find_full_scans runs EXPLAIN QUERY PLAN over HOT_QUERIES and over the SQL the
+real read functions (get_entries_page, get_entries_df, find_existing_goals_like,
+...) issue, so a query change that loses its index fails here.
+"""
+import json
+import sqlite3
+
+import pytest
+
+import database as db
+from classifier import ClassificationResult
+
+
+@pytest.fixture(autouse=True)
+def _close_pool():
+    yield
+    db.close_conns()
+
+
+def _fill(path):
+    results = [
+        ClassificationResult(entry=f"I want to save money for a car, day {i}", main_category="Goals",
+                             secondary_category="Plans", sub_category="Savings/Finance",
+                             confidence_scores={"Goals": 0.6, "Plans": 0.3})
+        for i in range(20)
+    ]
+    db.save_entries(results, db_path=path)
+    db.add_goal("save money for a car", category="Goals", db_path=path)
+    db.add_goal("run a marathon", category="Health", status="completed", db_path=path)
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    db.init_db(path)
+    _fill(path)
+    return path
+
+
+@pytest.fixture
+def migrated_db(tmp_path):
+    """A database written by the original schema, then brought up to date by init_db."""
+    path = str(tmp_path / "baseline.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(db.BASE_SCHEMA)
+    conn.execute("INSERT INTO users (user_id, username) VALUES (?, 'default_user')", (db.DEFAULT_USER_ID,))
+    for i in range(20):
+        cur = conn.execute(
+            "INSERT INTO entries (user_id, entry_text, main_category, sub_category, confidence_scores) "
+            "VALUES (?, ?, 'Goals', 'Savings/Finance', ?)",
+            (db.DEFAULT_USER_ID, f"I want to save money, day {i}", json.dumps({"Goals": 0.6, "Plans": 0.3})))
+        conn.executemany("INSERT INTO tags (entry_id, tag) VALUES (?, ?)",
+                         [(cur.lastrowid, "Goals"), (cur.lastrowid, "Savings/Finance")])
+    conn.execute("INSERT INTO goals (user_id, goal_text, category) VALUES (?, 'save money for a car', 'Goals')",
+                 (db.DEFAULT_USER_ID,))
+    conn.commit()
+    conn.close()
+    db.init_db(path)
+    assert db.schema_version(path) == len(db.MIGRATIONS)
+    return path
+
+
+@pytest.mark.parametrize("fixture", ["fresh_db", "migrated_db"])
+def test_no_full_scans(fixture, request):
+    path = request.getfixturevalue(fixture)
+    assert db.find_full_scans(path) == {}
+
+
+def test_request_path_sql_is_checked(fresh_db):
+    traced = db.trace_hot_paths(fresh_db)
+    assert traced["get_entries_page_filtered"] and traced["find_existing_goals_like"]
+    if "get_entries_df" in traced:
+        assert traced["get_entries_df"]
+
+
+def test_lost_index_is_reported(fresh_db):
+    conn = db.get_conn(fresh_db)
+    for index in ("idx_entries_user_created", "idx_entries_user_category_created"):
+        conn.execute(f"DROP INDEX {index}")
+    bad = db.find_full_scans(fresh_db)
+    assert "get_entries_page[0]" in bad
+    assert any(step.startswith("SCAN e") for step in bad["get_entries_page[0]"])
@@ -0,0 +1,309 @@
+# transcription.py
+"""Speech-to-text for voice entries with Whisper.
+
+Audio never touches disk: uploads are decoded by an ffmpeg pipe straight into
+a float32 NumPy buffer, and live (webrtc) frames are fed to
+StreamingTranscriber as arrays. Whisper models are loaded once per process.
+On CPU, "tiny" or "base" transcribe faster than real time; larger models
+may fall behind a live stream.
+"""
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import time
+from json import dumps, loads
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import DB_PATH, get_conn, transaction
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # what Whisper expects
+WHISPER_MODELS = ("tiny", "tiny.en", "base", "base.en", "small", "small.en")
+DEFAULT_WHISPER_MODEL = os.environ.get("DIARY_WHISPER_MODEL", "base")
+MAX_CHUNK_S = 30.0  # Whisper's context window
+
+_models: Dict[str, object] = {}
+# Whisper installs kv-cache hooks on the model per decode call, so one model
+# must not run two transcriptions at once
+_model_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def get_whisper(name: str = DEFAULT_WHISPER_MODEL):
+    """Return the shared Whisper model, loading it on first use."""
+    if name not in WHISPER_MODELS:
+        raise ValueError(f"Unknown Whisper model {name!r}, expected one of {WHISPER_MODELS}")
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name not in _models:
+            import torch
+            import whisper
+
+            t0 = time.time()
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            _models[name] = whisper.load_model(name, device=device)
+            _model_locks[name] = threading.Lock()
+            logger.info("Whisper %s loaded on %s in %.1fs", name, device, time.time() - t0)
+        return _models[name]
+
+
+def decode_audio(data: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode any ffmpeg-readable audio held in memory to mono float32 PCM.
+
+    ffmpeg writes raw float32 samples to a pipe and the returned array is a
+    view over the bytes read from it, so there is no temp file and no
+    conversion copy.
+    """
+    proc = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            proc.stdin.write(data)
+        except BrokenPipeError:
+            pass
+        finally:
+            proc.stdin.close()
+
+    with span("audio_decode"):
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+        buf = bytearray()
+        while True:
+            block = proc.stdout.read(1 << 20)
+            if not block:
+                break
+            buf += block
+        writer.join()
+        err = proc.stderr.read()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode audio: {err.decode(errors='replace').strip()}")
+    # bytearray keeps the view writable, which torch.from_numpy (inside Whisper) wants
+    return np.frombuffer(buf, dtype=np.float32)
+
+
+def audio_key(audio, model_name: str) -> str:
+    """Cache key for raw audio bytes or a PCM array (hashed through the buffer protocol, no copy)."""
+    h = hashlib.sha256(model_name.encode("utf-8") + b"\0")
+    h.update(np.ascontiguousarray(audio) if isinstance(audio, np.ndarray) else audio)
+    return h.hexdigest()
+
+
+class TranscriptCache:
+    """Size-bounded LRU of transcripts in SQLite, keyed by a hash of the audio and the model name."""
+
+    def __init__(self, db_path: str = DB_PATH, max_entries: int = 2000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        get_conn(self.db_path).executescript("""
+        CREATE TABLE IF NOT EXISTS transcripts (
+            audio_key TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            segments TEXT NOT NULL,
+            last_used REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_transcripts_last_used ON transcripts(last_used);
+        """)
+
+    def get(self, key: str) -> Optional[Tuple[str, List[Dict]]]:
+        row = get_conn(self.db_path).execute(
+            "SELECT text, segments FROM transcripts WHERE audio_key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        with transaction(self.db_path) as t:
+            t.execute("UPDATE transcripts SET last_used = ? WHERE audio_key = ?", (time.time(), key))
+        return row[0], loads(row[1])
+
+    def put(self, key: str, text: str, segments: List[Dict]):
+        with transaction(self.db_path) as t:
+            t.execute("INSERT OR REPLACE INTO transcripts (audio_key, text, segments, last_used) VALUES (?, ?, ?, ?)",
+                      (key, text, dumps(segments), time.time()))
+            t.execute("""
+            DELETE FROM transcripts WHERE audio_key IN (
+                SELECT audio_key FROM transcripts ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """, (self.max_entries,))
+
+
+def transcribe(audio: np.ndarray, model_name: str = DEFAULT_WHISPER_MODEL, cache: Optional[TranscriptCache] = None,
+               language: Optional[str] = None, initial_prompt: Optional[str] = None,
+               key: Optional[str] = None) -> Tuple[str, List[Dict]]:
+    """Transcribe 16 kHz mono float32 audio; returns (text, [{"start", "end", "text"}])."""
+    key = key or audio_key(audio, model_name)
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+    model = get_whisper(model_name)
+    with span("transcribe"), _model_locks[model_name]:
+        out = model.transcribe(audio, language=language, initial_prompt=initial_prompt, temperature=0.0,
+                               fp16=model.device.type == "cuda", condition_on_previous_text=False)
+    segments = [{"start": round(s["start"], 2), "end": round(s["end"], 2), "text": s["text"].strip()}
+                for s in out["segments"]]
+    text = " ".join(s["text"] for s in segments if s["text"])
+    if cache is not None:
+        cache.put(key, text, segments)
+    return text, segments
+
+
+def transcribe_bytes(data: bytes, model_name: str = DEFAULT_WHISPER_MODEL, cache: Optional[TranscriptCache] = None,
+                     language: Optional[str] = None) -> Tuple[str, List[Dict]]:
+    """Transcribe an uploaded audio file; a cache hit skips decoding entirely."""
+    key = audio_key(data, model_name)
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+    return transcribe(decode_audio(data), model_name, cache=cache, language=language, key=key)
+
+
+def _frame_rms(audio: np.ndarray, frame: int) -> np.ndarray:
+    usable = len(audio) - len(audio) % frame
+    if not usable:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:usable].reshape(-1, frame)  # a view, not a copy
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+class StreamingTranscriber:
+    """Incremental transcription of a live 16 kHz mono float32 stream.
+
+    ``feed`` only queues the caller's arrays. A daemon thread transcribes the
+    stream ``chunk_s`` seconds at a time, cutting at the quietest 20 ms near
+    the end of each chunk so words are not split; when it falls behind it
+    takes longer chunks (up to Whisper's 30 s window) to catch up. Text is
+    collected until the speaker pauses for ``pause_s`` seconds (or ``close``
+    is called) and each finished segment is passed to ``on_segment``.
+
+    Live chunks are never transcribed twice and each one is decoded with the
+    previous text as its prompt, so they bypass the TranscriptCache.
+    """
+
+    def __init__(self, on_segment: Callable[[str], None], model_name: str = DEFAULT_WHISPER_MODEL,
+                 chunk_s: float = 5.0, pause_s: float = 3.0, silence_rms: float = 0.01,
+                 language: Optional[str] = None):
+        self.on_segment = on_segment
+        self.model_name = model_name
+        self.chunk = int(chunk_s * SAMPLE_RATE)
+        self.pause = pause_s
+        self.silence_rms = silence_rms
+        self.language = language
+        self.frame = SAMPLE_RATE // 50
+        self.segments: List[str] = []
+        self.partial = ""
+        self.error: Optional[str] = None
+        self._buffers: List[np.ndarray] = []
+        self._buffered = 0
+        self._silence = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="voice-transcriber", daemon=True)
+        self._thread.start()
+
+    def feed(self, samples: np.ndarray):
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        with self._cond:
+            self._buffers.append(samples)
+            self._buffered += len(samples)
+            if self._buffered >= self.chunk:
+                self._cond.notify()
+
+    def close(self, timeout: Optional[float] = None) -> List[str]:
+        """Transcribe what is left, flush the last segment and return all segments."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        return self.segments
+
+    def _take(self) -> Tuple[Optional[np.ndarray], bool]:
+        with self._cond:
+            while self._buffered < self.chunk and not self._closed:
+                self._cond.wait()
+            closed = self._closed
+            if not self._buffered:
+                return None, closed
+            audio = np.concatenate(self._buffers) if len(self._buffers) > 1 else self._buffers[0]
+            n = min(len(audio), int(MAX_CHUNK_S * SAMPLE_RATE))
+            if not closed or n < len(audio):
+                n = self._cut(audio, n)
+            # A pause inside the window ends the segment there, even when catching up on a backlog
+            n = min(n, self._pause_end(audio[:n]) or n)
+            rest = audio[n:]
+            self._buffers = [rest] if len(rest) else []
+            self._buffered = len(rest)
+            return audio[:n], closed and not len(rest)
+
+    def _cut(self, audio: np.ndarray, n: int) -> int:
+        """Quietest frame boundary in the last second before n."""
+        lo = max(0, n - SAMPLE_RATE)
+        rms = _frame_rms(audio[lo:n], self.frame)
+        if not len(rms):
+            return n
+        return lo + (int(np.argmin(rms)) + 1) * self.frame
+
+    def _pause_end(self, audio: np.ndarray) -> Optional[int]:
+        """Sample offset where the first pause of pause_s after some speech is complete, if any."""
+        need = int(self.pause * SAMPLE_RATE / self.frame)
+        speech = bool(self.partial)
+        run = int(self._silence * SAMPLE_RATE / self.frame) if speech else 0
+        for i, silent in enumerate(_frame_rms(audio, self.frame) < self.silence_rms):
+            if not silent:
+                speech, run = True, 0
+                continue
+            run += 1
+            if speech and run >= need:
+                return (i + 1) * self.frame
+        return None
+
+    def _emit(self):
+        text = self.partial.strip()
+        self.partial = ""
+        if text:
+            self.segments.append(text)
+            try:
+                self.on_segment(text)
+            except Exception:
+                logger.exception("Voice segment handler failed")
+
+    def _run(self):
+        try:
+            get_whisper(self.model_name)
+        except Exception as e:
+            self.error = str(e)
+            logger.exception("Whisper model failed to load")
+            return
+        while True:
+            audio, done = self._take()
+            if audio is not None:
+                rms = _frame_rms(audio, self.frame)
+                loud = np.flatnonzero(rms >= self.silence_rms)
+                if len(loud):
+                    self._silence = (len(rms) - 1 - loud[-1]) * self.frame / SAMPLE_RATE
+                    try:
+                        text, _ = transcribe(audio, self.model_name, language=self.language,
+                                             initial_prompt=self.partial[-200:] or None)
+                        self.partial = f"{self.partial} {text}".strip()
+                    except Exception as e:
+                        self.error = str(e)
+                        logger.exception("Transcription failed")
+                else:
+                    # Silent chunk: nothing worth running the model on
+                    self._silence += len(audio) / SAMPLE_RATE
+                if self._silence >= self.pause:
+                    self._emit()
+            if done:
+                self._emit()
+                return
@@ -0,0 +1,103 @@
+# zero_shot.py
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+
+class ZeroShotEngine:
+    """NLI zero-shot scorer that shares the premise across all hypothesis labels.
+
+    The premise is tokenized once and every (premise, hypothesis) pair for an
+    entry -- main labels, subcategory labels, or both -- is packed into the same
+    padded forward pass. Scores match the transformers zero-shot pipeline with
+    ``multi_label=False``: a softmax over entailment logits within each label group.
+    """
+
+    def __init__(self, model, tokenizer, hypothesis_template: str = HYPOTHESIS_TEMPLATE, premise_cache_size: int = 256):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.hypothesis_template = hypothesis_template
+        self.entailment_id = self._label_id(model.config.label2id, "entail")
+        self.max_length = min(getattr(tokenizer, "model_max_length", 1024) or 1024, 1024)
+        self._n_special = tokenizer.num_special_tokens_to_add(pair=True)
+        self._premise_ids = lru_cache(maxsize=premise_cache_size)(self._tokenize)
+        self._hypothesis_ids = lru_cache(maxsize=None)(self._tokenize_hypothesis)
+
+    @staticmethod
+    def _label_id(label2id: Dict[str, int], prefix: str) -> int:
+        for label, idx in label2id.items():
+            if label.lower().startswith(prefix):
+                return idx
+        return -1
+
+    def _tokenize(self, text: str) -> Tuple[int, ...]:
+        return tuple(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _tokenize_hypothesis(self, label: str) -> Tuple[int, ...]:
+        return self._tokenize(self.hypothesis_template.format(label))
+
+    def _pair(self, premise: Tuple[int, ...], hypothesis: Tuple[int, ...]) -> List[int]:
+        room = self.max_length - len(hypothesis) - self._n_special
+        return self.tokenizer.build_inputs_with_special_tokens(list(premise[:room]), list(hypothesis))
+
+    def entailment_logits(self, premises: Sequence[str], labels: Sequence[Sequence[str]], batch_size: int = 32) -> List[List[float]]:
+        """Return the raw entailment logit of every label for every premise."""
+        import torch
+
+        pairs, owners = [], []
+        for i, (premise, cand) in enumerate(zip(premises, labels)):
+            p_ids = self._premise_ids(premise)
+            for label in cand:
+                pairs.append(self._pair(p_ids, self._hypothesis_ids(label)))
+                owners.append(i)
+
+        # Sort by length so each padded batch wastes as little as possible
+        order = sorted(range(len(pairs)), key=lambda k: len(pairs[k]))
+        flat = [0.0] * len(pairs)
+        device = getattr(self.model, "device", None) or "cpu"
+        with torch.no_grad():
+            for start in range(0, len(order), batch_size):
+                idx = order[start:start + batch_size]
+                enc = self.tokenizer.pad({"input_ids": [pairs[k] for k in idx]}, return_tensors="pt")
+                enc = {k: v.to(device) for k, v in enc.items()}
+                logits = self.model(**enc).logits[:, self.entailment_id].float().cpu().tolist()
+                for k, v in zip(idx, logits):
+                    flat[k] = v
+
+        out: List[List[float]] = [[] for _ in premises]
+        for owner, v in zip(owners, flat):
+            out[owner].append(v)
+        return out
+
+    @staticmethod
+    def softmax(labels: Sequence[str], logits: Sequence[float]) -> Dict:
+        """Pipeline-style output (labels sorted by descending score) from entailment logits."""
+        import math
+
+        top = max(logits)
+        exp = [math.exp(v - top) for v in logits]
+        total = sum(exp)
+        ranked = sorted(zip(labels, (e / total for e in exp)), key=lambda x: -x[1])
+        return {"labels": [l for l, _ in ranked], "scores": [s for _, s in ranked]}
+
+    def embed(self, texts: Sequence[str], batch_size: int = 16) -> List[List[float]]:
+        """Unit-length mean-pooled encoder states, reusing the already loaded NLI model."""
+        import torch
+
+        if not hasattr(self.model, "get_encoder"):
+            raise NotImplementedError("Embeddings need the pytorch or quantized backend")
+        encoder = self.model.get_encoder()
+        device = getattr(self.model, "device", None) or "cpu"
+        out: List[List[float]] = []
+        with torch.no_grad():
+            for start in range(0, len(texts), batch_size):
+                ids = [self.tokenizer.build_inputs_with_special_tokens(list(self._premise_ids(t)[:self.max_length - 2]))
+                       for t in texts[start:start + batch_size]]
+                enc = self.tokenizer.pad({"input_ids": ids}, return_tensors="pt")
+                enc = {k: v.to(device) for k, v in enc.items()}
+                hidden = encoder(input_ids=enc["input_ids"], attention_mask=enc["attention_mask"]).last_hidden_state
+                mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = torch.nn.functional.normalize((hidden * mask).sum(1) / mask.sum(1), dim=-1)
+                out.extend(pooled.float().cpu().tolist())
+        return out